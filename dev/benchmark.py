@@ -0,0 +1,355 @@
+"""
+Benchmarks of multiai
+
+Usage:
+    python benchmark.py [name ...]
+
+Available benchmarks are listed by python benchmark.py -h.
+Load benchmarks (single, multi, stream and batch) use the mock provider,
+so that they need neither network nor API keys.
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import subprocess
+import sys
+
+# Run with the source tree rather than the installed package
+here = os.path.abspath(os.path.dirname(__file__))
+src = os.path.join(here, '..', 'src')
+env = dict(os.environ, PYTHONPATH=src)
+
+# Number of questions asked in each load benchmark
+QUESTIONS = 200
+
+# Modules imported when each provider is used
+provider_modules = {
+    'openai': 'openai',
+    'anthropic': 'anthropic',
+    'google': 'google.generativeai',
+    'perplexity': 'openai',
+    'mistral': 'mistralai',
+    'local': 'openai',
+}
+
+
+def import_time(code):
+    """
+    Measure import time with python -X importtime.
+
+    :param code: str
+        Python code to run
+    :return: tuple or None
+        (total time in seconds, list of (cumulative seconds, module)
+        of all imports sorted in descending order),
+        or None when the code fails
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    total = 0
+    top = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        seconds = int(cumulative) / 1e6
+        # Top-level imports are not indented.
+        if not module[1:].startswith(' '):
+            total += seconds
+        top.append((seconds, module.strip()))
+    return total, sorted(top, reverse=True)
+
+
+def wall_time(args, repeat):
+    """
+    Measure wall time of a command.
+
+    :param args: list
+        command-line arguments
+    :param repeat: int
+        number of runs
+    :return: float
+        median of wall time in seconds
+    """
+    import time
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(args, env=env, capture_output=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def bench_startup(repeat):
+    """
+    Startup time of the ai command and import time of provider SDKs.
+    """
+    base, top = import_time('import multiai')
+    print(f'import multiai: {base * 1000:.1f} ms')
+    for seconds, module in top[:10]:
+        print(f'  {seconds * 1000:8.1f} ms  {module}')
+    seconds = wall_time([sys.executable, '-m', 'multiai', '--help'], repeat)
+    print(f'ai --help: {seconds * 1000:.1f} ms (median of {repeat} runs)')
+    print('Additional import time when a provider is used:')
+    eager = 0
+    for module in sorted(set(provider_modules.values())):
+        providers = [p for p, m in provider_modules.items() if m == module]
+        result = import_time(f'import multiai, {module}')
+        if result is None:
+            print(f'  {", ".join(providers)}: {module} is not installed')
+            continue
+        eager += result[0] - base
+        print(f'  {", ".join(providers)}: {(result[0] - base) * 1000:.1f} ms')
+    print(f'  all SDKs (imported at startup before lazy import): {eager * 1000:.1f} ms')
+
+
+def bench_prompt(repeat):
+    """
+    Construction time of Prompt objects.
+    """
+    import timeit
+    sys.path.insert(0, src)
+    import multiai
+    number = 1000
+    timer = timeit.Timer(multiai.Prompt)
+    first = timer.timeit(number=1)
+    times = timer.repeat(repeat=repeat, number=number)
+    print(f'first Prompt(): {first * 1e6:.1f} us')
+    print(f'Prompt(): {min(times) / number * 1e6:.1f} us '
+          f'(best of {repeat} runs of {number})')
+    settings = multiai.load_settings()
+    timer = timeit.Timer(lambda: multiai.Prompt(settings=settings))
+    times = timer.repeat(repeat=repeat, number=number)
+    print(f'Prompt(settings=settings): {min(times) / number * 1e6:.1f} us')
+    client = multiai.Prompt()
+    timer = timeit.Timer(lambda: client.version)
+    print(f'Prompt().version: '
+          f'{min(timer.repeat(repeat=repeat, number=number)) / number * 1e6:.2f} us')
+
+
+def bench_wrap(repeat):
+    """
+    Wrapping and page fitting of 100 KB answers by print_long.
+    """
+    import timeit
+    sys.path.insert(0, src)
+    from multiai import printlong
+    paragraphs = {
+        'ASCII': 'The quick brown fox jumps over the lazy dog. ' * 10,
+        'CJK': '土壌は岩石の風化物と生物の遺体からなる。' * 10,
+        'mixed': 'Soil (土壌) is a mixture of minerals and 有機物. ' * 10,
+    }
+    for name, paragraph in paragraphs.items():
+        text = '\n\n'.join([paragraph] * (100000 // len(paragraph)))
+        lines = text.split('\n')
+        for label, func in [
+                ('wrap_text', lambda: [printlong.wrap_text(line, 80)
+                                       for line in lines]),
+                ('fits_in_page (1 page)',
+                 lambda: printlong.fits_in_page(lines, 80, 40)),
+                ('fits_in_page (all)',
+                 lambda: printlong.fits_in_page(lines, 80, 10**6)),
+                ('calculate_display_width',
+                 lambda: [printlong.calculate_display_width(line) for line in lines])]:
+            seconds = min(timeit.repeat(func, repeat=repeat, number=1))
+            print(f'{name:6} {label:24} {seconds * 1000:8.2f} ms')
+
+
+def mock_client(latency=0, tokens_per_second=0, answer_tokens=100,
+                finish_reasons=()):
+    """
+    Make a client of the mock provider which uses no files.
+
+    :param latency: float
+        seconds until the first token
+    :param tokens_per_second: float
+        rate of making tokens, or 0 to make them at once
+    :param answer_tokens: int
+        number of tokens of an answer
+    :param finish_reasons: tuple
+        finish reasons of the requests of a question
+    :return: Prompt
+        client
+    """
+    sys.path.insert(0, src)
+    import multiai
+    from multiai.settings import Settings, default_files
+    # User settings such as max_tokens would change the load.
+    client = multiai.Prompt(settings=Settings(default_files()[:1]))
+    client.sessions = None
+    client.cache = None
+    client.metrics_file = None
+    client.history_policy = 'none'
+    client.set_provider('mock')
+    client.ai_providers = [client.ai_provider]
+    client.mock_latency = latency
+    client.mock_tokens_per_second = tokens_per_second
+    client.mock_answer_tokens = answer_tokens
+    client.mock_finish_reasons = list(finish_reasons)
+    client.mock_error_rate = 0
+    return client
+
+
+def load(label, run):
+    """
+    Run a load and show throughput, tail latency and peak memory.
+
+    The load is run twice, first for time and then for memory, because
+    tracing memory slows Python down.
+
+    :param label: str
+        label to show
+    :param run: function
+        function which runs the load and returns latencies in seconds
+    """
+    import time
+    import tracemalloc
+    start = time.perf_counter()
+    latencies = run()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+    print(f'{label:38} {len(latencies) / elapsed:8.1f} q/s  '
+          f'p50 {cuts[49] * 1000:7.2f}  p95 {cuts[94] * 1000:7.2f}  '
+          f'p99 {cuts[98] * 1000:7.2f} ms  peak {peak / 1e6:6.2f} MB')
+
+
+def timed(func):
+    """
+    Call a function and measure its wall time.
+
+    :param func: function
+        function without arguments
+    :return: float
+        seconds
+    """
+    import time
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def bench_single(repeat):
+    """
+    Questions to one mock provider one after another.
+    """
+    def questions(client, chat=False):
+        def run():
+            latencies = []
+            client.clear()
+            for i in range(QUESTIONS):
+                if not chat:
+                    client.clear()
+                latencies.append(timed(lambda: client.ask(f'Question {i}')))
+            return latencies
+        return run
+
+    load('overhead (no latency)', questions(mock_client()))
+    load(f'chat of {QUESTIONS} turns (no latency)',
+         questions(mock_client(), chat=True))
+    load('3 continued requests (no latency)', questions(
+        mock_client(finish_reasons=('length', 'length', 'stop'))))
+    load('latency 10 ms', questions(mock_client(latency=0.01)))
+
+
+def bench_multi(repeat):
+    """
+    Questions to three mock providers at once or one after another.
+    """
+    for parallel in [True, False]:
+        client = mock_client(latency=0.01)
+        client.ai_providers = [client.ai_provider] * 3
+        client.parallel = parallel
+
+        def run():
+            client.clear()
+            return [timed(lambda: client.ask_providers(f'Question {i}'))
+                    for i in range(QUESTIONS // 4)]
+        mode = 'parallel' if parallel else 'sequential'
+        load(f'3 providers {mode}, latency 10 ms', run)
+
+
+def bench_stream(repeat):
+    """
+    Streamed answers of 100 tokens at 5000 tokens per second.
+    """
+    import time
+    client = mock_client(latency=0.01, tokens_per_second=5000)
+    first_tokens = []
+
+    def run():
+        latencies = []
+        first_tokens.clear()
+        for i in range(QUESTIONS // 4):
+            client.clear()
+            start = time.perf_counter()
+            for n, chunk in enumerate(client.ask_stream(f'Question {i}')):
+                if n == 0:
+                    first_tokens.append(time.perf_counter() - start)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+    load('whole answer, latency 10 ms', run)
+    cuts = statistics.quantiles(first_tokens, n=100, method='inclusive')
+    print(f'{"first token":38} {"":12}  p50 {cuts[49] * 1000:7.2f}  '
+          f'p95 {cuts[94] * 1000:7.2f}  p99 {cuts[98] * 1000:7.2f} ms')
+
+
+def bench_batch(repeat):
+    """
+    Batch mode of 200 prompts to a mock provider with latency 10 ms.
+    """
+    sys.path.insert(0, src)
+    from multiai.batch import run_batch
+    for concurrency in [1, 4, 16]:
+        client = mock_client(latency=0.01)
+        latencies = []
+        client.add_hook(lambda metrics: latencies.append(metrics['seconds']))
+        records = [{'id': i, 'prompt': f'Question {i}', 'provider': None,
+                    'model': None} for i in range(QUESTIONS)]
+
+        def run():
+            latencies.clear()
+            # Progress is shown to stderr.
+            with contextlib.redirect_stderr(io.StringIO()):
+                run_batch(client, records, os.devnull,
+                          concurrency=concurrency)
+            return list(latencies)
+        load(f'concurrency {concurrency}', run)
+
+
+benchmarks = {
+    'startup': bench_startup,
+    'prompt': bench_prompt,
+    'wrap': bench_wrap,
+    'single': bench_single,
+    'multi': bench_multi,
+    'stream': bench_stream,
+    'batch': bench_batch,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of multiai')
+    parser.add_argument('name', nargs='*',
+                        help=f'benchmarks to run from {", ".join(benchmarks)}. Default is all.')
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='number of repetitions. Default is 5.')
+    args = parser.parse_args()
+    for name in args.name:
+        if name not in benchmarks:
+            parser.error(f'unknown benchmark: {name}')
+    for name in args.name or benchmarks:
+        print(f'=== {name}: {benchmarks[name].__doc__.strip()}')
+        benchmarks[name](args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -24,6 +24,10 @@ models = [
     'open-mistral-nemo']
 
 log_file = 'chat-ai-DATE.md'
+# Address of multiai server started by `ai --serve`, such as
+# '~/.cache/multiai/server.sock' or '127.0.0.1:8765'. Empty to ask AI in
+# this process.
+server = ''
 log_file = os.path.expanduser(log_file)
 log_file = log_file.replace('DATE', datetime.today().strftime('%Y%m%d'))
 
@@ -39,6 +43,29 @@ def get_provider(model):
               Check model name or `get_provider` function.''')
     sys.exit()
 
+# Client asking multiai server, which has the methods of multiai.Prompt
+# used in this app
+class ServerPrompt():
+    def __init__(self, address):
+        from multiai.remote import RemoteClient
+        self.remote = RemoteClient(address)
+        self.version = self.remote.health()['version']
+        self.session = self.remote.new_session()
+        self.provider = None
+        self.model = None
+
+    def set_model(self, provider, model):
+        self.provider = provider
+        self.model = model
+
+    def ask(self, prompt):
+        return self.remote.ask(prompt, session=self.session,
+                               provider=self.provider, model=self.model)['answer']
+
+    def clear(self):
+        self.remote.delete_session(self.session)
+        self.session = self.remote.new_session()
+
 # Functions for pressing buttons
 def btn_copy(text):
     clipboard.copy(text)
@@ -49,7 +76,10 @@ def btn_clear():
 
 # Reload client
 if st.session_state.get('client') is None:
-    st.session_state['client'] = multiai.Prompt()
+    if server:
+        st.session_state['client'] = ServerPrompt(server)
+    else:
+        st.session_state['client'] = multiai.Prompt()
     st.session_state['chat_messages'] = []
     initial = True
 else:
@@ -97,17 +127,6 @@ if initial:
         "Save log file," the file will be saved to `{log_file}`.
         You can change the location by editing the `log_file` parameter.''')
 
-# Check if provider is changed
-if len(st.session_state['chat_messages']) > 0:
-    if provider != st.session_state['provider']:
-        st.write('''Your chat history has been cleared because you switched
-                AI providers. Chat history is stored separately for each
-                provider. You can continue conversations with different
-                models from the same provider, but not with models from
-                different providers.''')
-        btn_clear()
-st.session_state['provider'] = provider
-
 # Reload chat messages
 if st.session_state.get('chat_messages') is None:
     st.session_state['chat_messages'] = []
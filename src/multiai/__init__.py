@@ -1,4 +1,24 @@
 """init.py."""
+import importlib
 from .entry import entry
-from .multiai import Prompt, Provider
-from .printlong import print_long
+
+# Modules of the other names, which are imported when used, so that ai
+# command forwarded to multiai server does not load the SDKs.
+_exports = {
+    'Prompt': 'multiai',
+    'Provider': 'multiai',
+    'print_long': 'printlong',
+    'Backend': 'registry',
+    'Settings': 'settings',
+    'load_settings': 'settings',
+}
+
+__all__ = ['entry'] + list(_exports)
+
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module('.' + _exports[name], __name__), name)
+    globals()[name] = value
+    return value
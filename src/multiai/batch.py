@@ -0,0 +1,174 @@
+"""
+batch - ask many prompts read from a file
+"""
+import concurrent.futures
+import json
+import os
+import sys
+from .multiai import Provider
+
+__all__ = [
+    "read_prompts",
+    "run_batch",
+]
+
+
+def read_prompts(file):
+    """
+    Read prompts for batch mode.
+
+    Each line is either a JSON object or a plain text prompt.
+    A JSON object has "prompt" and optionally "id", "provider" and "model".
+    A plain text line is a prompt by itself. When "id" is not given,
+    the line number is used. Blank lines are skipped.
+
+    :param file: file object
+        file to read prompts from
+    :return: generator
+        dict with keys of "id", "prompt", "provider" and "model"
+    """
+    for number, line in enumerate(file, start=1):
+        line = line.strip()
+        if line == '':
+            continue
+        if line.startswith('{'):
+            try:
+                record = json.loads(line)
+                prompt = record['prompt']
+            except (ValueError, KeyError):
+                print(f'Invalid prompt at line {number}: {line}')
+                sys.exit(1)
+        else:
+            record = {}
+            prompt = line
+        yield {
+            'id': record.get('id', number),
+            'prompt': prompt,
+            'provider': record.get('provider'),
+            'model': record.get('model'),
+        }
+
+
+def run_batch(client, records, output, concurrency=4,
+              order='input', pre_prompt=''):
+    """
+    Ask prompts and write the answers as JSON lines.
+
+    Each prompt is asked to the provider given in the record, or to every
+    provider in client.ai_providers, without chat history.
+    When output file already has answers, the prompts answered without
+    error are skipped, so that an interrupted run can be resumed.
+
+    :param client: Prompt
+        client whose settings are used
+    :param records: iterable
+        records returned by read_prompts()
+    :param output: str
+        file to write answers to, or '-' for standard output
+    :param concurrency: int
+        maximum number of requests at once for each provider
+    :param order: str
+        'input' to write answers in the order of prompts,
+        'completion' to write answers as soon as they are finished
+    :param pre_prompt: str
+        pre-prompt to append before each prompt
+    """
+    done = _read_done(output)
+    executors = {}
+    futures = []
+    for record in records:
+        if record['provider'] is None:
+            providers = client.ai_providers or [client.ai_provider]
+        else:
+            try:
+                providers = [Provider[record['provider'].upper()]]
+            except Exception:
+                print(f'AI provider "{record["provider"]}" is not available.')
+                sys.exit(1)
+        for provider in providers:
+            if (record['id'], provider.name.lower()) in done:
+                continue
+            if provider not in executors:
+                executors[provider] = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=concurrency)
+            futures.append(executors[provider].submit(
+                _ask, client, provider, record, pre_prompt))
+    if order == 'completion':
+        results = concurrent.futures.as_completed(futures)
+    else:
+        results = futures
+    if output == '-':
+        f = sys.stdout
+    else:
+        f = open(output, mode='a')
+    try:
+        for count, future in enumerate(results, start=1):
+            f.write(json.dumps(future.result(), ensure_ascii=False) + '\n')
+            f.flush()
+            if output != '-':
+                print(f'{count}/{len(futures)}\r', end='', file=sys.stderr)
+    finally:
+        if output != '-':
+            f.close()
+        for executor in executors.values():
+            executor.shutdown(cancel_futures=True)
+    if output != '-' and futures:
+        print(file=sys.stderr)
+
+
+def _ask(client, provider, record, pre_prompt):
+    """
+    Ask a prompt of batch mode.
+
+    :param client: Prompt
+        client whose settings are used
+    :param provider: Provider
+        AI provider
+    :param record: dict
+        record returned by read_prompts()
+    :param pre_prompt: str
+        pre-prompt to append before prompt
+    :return: dict
+        result to write
+    """
+    job = client._fork(provider)
+    # Each prompt is asked without chat history.
+    job.clear()
+    if record['model'] is not None:
+        job.set_model(provider.name, record['model'])
+    answer = job.ask(pre_prompt + record['prompt'])
+    return {
+        'id': record['id'],
+        'provider': provider.name.lower(),
+        'model': job.model,
+        'answer': str(answer),
+        'error': job.error,
+    }
+
+
+def _read_done(output):
+    """
+    Read prompts already answered without error in the output file.
+
+    :param output: str
+        output file
+    :return: set
+        (id, provider) of answered prompts
+    """
+    done = set()
+    if output == '-' or not os.path.exists(output):
+        return done
+    with open(output) as f:
+        lines = f.readlines()
+    if lines and not lines[-1].endswith('\n'):
+        # Terminate the line partially written when the run was interrupted
+        with open(output, mode='a') as f:
+            f.write('\n')
+    for line in lines:
+        try:
+            result = json.loads(line)
+        except ValueError:
+            continue
+        if not result.get('error'):
+            done.add((result['id'], result['provider']))
+    return done
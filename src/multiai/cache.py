@@ -0,0 +1,246 @@
+"""
+cache - on-disk cache of responses from AI and retrieved web pages
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+__all__ = [
+    "ResponseCache",
+    "PageCache",
+]
+
+
+class _Database():
+    """
+    SQLite database shared by threads, opened at the first use.
+
+    Subclasses define the table with schema, which has key, created and
+    accessed columns used for expiration and eviction.
+    """
+    schema = ''
+    table = ''
+
+    def __init__(self, file, ttl=None, max_entries=None):
+        """
+        :param file: str
+            database file
+        :param ttl: float
+            seconds until an entry expires, or None for no expiration
+        :param max_entries: int
+            maximum number of entries, or None for no limit.
+            Entries least recently used are removed first.
+        """
+        self.file = os.path.expanduser(file)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._puts = 0
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """
+        Remove all the entries.
+        """
+        with self._lock:
+            db = self._connect()
+            db.execute(f'DELETE FROM {self.table}')
+            db.commit()
+
+    def close(self):
+        """
+        Close the database.
+        """
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _connect(self):
+        """
+        Open the database at the first call.
+
+        :return: sqlite3.Connection
+            connection to the database
+        """
+        if self._connection is None:
+            import sqlite3
+            directory = os.path.dirname(self.file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Connection is shared by threads with self._lock.
+            self._connection = sqlite3.connect(
+                self.file, check_same_thread=False)
+            self._connection.executescript(self.schema)
+        return self._connection
+
+    def _get(self, key, columns):
+        """
+        Get an entry which is not expired, and update its access time.
+
+        :param key: str
+            key of the entry
+        :param columns: str
+            columns to get, separated by commas
+        :return: tuple or None
+            values of the columns, or None when not found
+        """
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            row = db.execute(
+                f'SELECT {columns}, created FROM {self.table} WHERE key = ?',
+                (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl is not None and row[-1] < now - self.ttl:
+                db.execute(f'DELETE FROM {self.table} WHERE key = ?', (key,))
+                db.commit()
+                return None
+            db.execute(f'UPDATE {self.table} SET accessed = ? WHERE key = ?',
+                       (now, key))
+            db.commit()
+        return row[:-1]
+
+    def _put(self, key, *values):
+        """
+        Put an entry, removing old entries from time to time.
+
+        :param key: str
+            key of the entry
+        :param values: tuple
+            values of the columns between key and created
+        """
+        now = time.time()
+        row = (key,) + values + (now, now)
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                f'INSERT OR REPLACE INTO {self.table} VALUES ({", ".join("?" * len(row))})',
+                row)
+            self._puts += 1
+            # Eviction scans the table, so it is not done at every put.
+            if self._puts % 100 == 1:
+                self._evict(db, now)
+            db.commit()
+
+    def _evict(self, db, now):
+        """
+        Remove expired entries and entries over max_entries.
+
+        :param db: sqlite3.Connection
+            connection to the database
+        :param now: float
+            current time
+        """
+        if self.ttl is not None:
+            db.execute(f'DELETE FROM {self.table} WHERE created < ?',
+                       (now - self.ttl,))
+        if self.max_entries is not None:
+            db.execute(
+                f'''DELETE FROM {self.table} WHERE key NOT IN (
+                    SELECT key FROM {self.table} ORDER BY accessed DESC LIMIT ?)''',
+                (self.max_entries,))
+
+
+class ResponseCache(_Database):
+    """
+    Cache of responses stored in a SQLite database.
+
+    Usage:
+        cache = ResponseCache('~/.cache/multiai/cache.sqlite')
+        key = cache.key(provider='openai', messages=messages)
+        cache.put(key, response, finish_reason)
+        response, finish_reason = cache.get(key)
+    """
+    schema = '''CREATE TABLE IF NOT EXISTS responses (
+        key TEXT PRIMARY KEY,
+        response TEXT,
+        finish_reason TEXT,
+        created REAL,
+        accessed REAL)'''
+    table = 'responses'
+
+    @staticmethod
+    def key(**request):
+        """
+        Make a key from the parameters of a request.
+
+        :param request: dict
+            parameters of the request such as provider, model and messages
+        :return: str
+            key
+        """
+        text = json.dumps(request, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def get(self, key):
+        """
+        Get a response from the cache.
+
+        :param key: str
+            key made by key()
+        :return: tuple or None
+            (response, finish_reason), or None when not found
+        """
+        return self._get(key, 'response, finish_reason')
+
+    def put(self, key, response, finish_reason):
+        """
+        Put a response into the cache.
+
+        :param key: str
+            key made by key()
+        :param response: str
+            response from AI
+        :param finish_reason: str
+            finish reason of the response
+        """
+        self._put(key, response, finish_reason)
+
+
+class PageCache(_Database):
+    """
+    Cache of text retrieved from URL, with validators of HTTP response.
+
+    Usage:
+        cache = PageCache('~/.cache/multiai/http.sqlite')
+        cache.put(key, text, etag, last_modified)
+        text, etag, last_modified = cache.get(key)
+    """
+    schema = '''CREATE TABLE IF NOT EXISTS pages (
+        key TEXT PRIMARY KEY,
+        text TEXT,
+        etag TEXT,
+        last_modified TEXT,
+        created REAL,
+        accessed REAL)'''
+    table = 'pages'
+
+    def get(self, key):
+        """
+        Get text from the cache.
+
+        :param key: str
+            key, such as URL
+        :return: tuple or None
+            (text, etag, last_modified), or None when not found
+        """
+        return self._get(key, 'text, etag, last_modified')
+
+    def put(self, key, text, etag, last_modified):
+        """
+        Put text into the cache.
+
+        :param key: str
+            key, such as URL
+        :param text: str
+            retrieved text
+        :param etag: str
+            ETag header of the response, or None
+        :param last_modified: str
+            Last-Modified header of the response, or None
+        """
+        self._put(key, text, etag, last_modified)
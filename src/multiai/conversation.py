@@ -0,0 +1,248 @@
+"""
+conversation - chat history shared by AI providers
+"""
+import threading
+from .history import summary_messages
+
+__all__ = [
+    "Conversation",
+    "Message",
+]
+
+
+class Message():
+    """
+    A message of a conversation.
+    """
+    __slots__ = ('role', 'content', 'provider')
+
+    def __init__(self, role, content, provider=None):
+        """
+        :param role: str
+            'user' or 'assistant'
+        :param content: str
+            text of the message
+        :param provider: str
+            name of the provider for which the message is, or None for a
+            prompt shared by all providers
+        """
+        self.role = role
+        self.content = content
+        self.provider = provider
+
+
+class Conversation():
+    """
+    Chat history shared by AI providers.
+
+    Messages are stored once in the order of addition, and they are
+    translated to the messages of a provider by messages(), so that the
+    conversation can be continued with any provider.
+
+    A conversation consists of turns. A turn starts with a prompt shared
+    by all providers, which is followed by the answers of the providers
+    asked in the turn. For a turn in which a provider was not asked, the
+    answer of the first provider is used.
+
+    A conversation can be saved to a SessionStore with save(), and read
+    from it with load(). After that, each message is saved when it is added.
+
+    Usage:
+        conversation = Conversation()
+        conversation.append('user', prompt)
+        conversation.append('assistant', answer, 'openai')
+        messages = conversation.messages('anthropic')
+    """
+    __slots__ = ('_messages', '_offset', '_lock', 'summary',
+                 '_store', '_session_id', '_loaded')
+
+    def __init__(self):
+        self._messages = []
+        # Number of messages replaced by the summary
+        self._offset = 0
+        self._lock = threading.Lock()
+        self.summary = None
+        self._store = None
+        self._session_id = None
+        self._loaded = True
+
+    def __len__(self):
+        with self._lock:
+            self._load()
+            return self._offset + len(self._messages)
+
+    @classmethod
+    def load(cls, store, session_id):
+        """
+        Return a conversation saved in a session.
+
+        Messages are read from the store at the first use, so that
+        resuming a long session does not wait for reading it.
+
+        :param store: SessionStore
+            store of sessions
+        :param session_id: str
+            id of the session
+        :return: Conversation
+            conversation which is saved to the session
+        """
+        conversation = cls()
+        conversation._store = store
+        conversation._session_id = session_id
+        conversation._loaded = False
+        return conversation
+
+    def save(self, store, session_id):
+        """
+        Save the conversation to a session, and keep saving the messages
+        added after that.
+
+        :param store: SessionStore
+            store of sessions
+        :param session_id: str
+            id of the session
+        """
+        with self._lock:
+            self._load()
+            self._store = store
+            self._session_id = session_id
+            if self.summary is not None:
+                store.summarize(session_id, self._offset, self.summary)
+            if self._messages:
+                store.append(session_id, [
+                    (self._offset + i, message.role, message.content,
+                     message.provider)
+                    for i, message in enumerate(self._messages)])
+
+    def append(self, role, content, provider=None):
+        """
+        Add a message.
+
+        :param role: str
+            'user' or 'assistant'
+        :param content: str
+            text of the message
+        :param provider: str
+            name of the provider for which the message is, or None for a
+            prompt shared by all providers
+        """
+        with self._lock:
+            self._load()
+            position = self._offset + len(self._messages)
+            self._messages.append(Message(role, content, provider))
+            if self._store is not None:
+                self._store.append(
+                    self._session_id, [(position, role, content, provider)])
+
+    def messages(self, provider):
+        """
+        Return the messages to send to a provider.
+
+        :param provider: str
+            name of the provider
+        :return: list
+            messages with "role" and "content", oldest first
+        """
+        return self.translate(provider)[0]
+
+    def translate(self, provider):
+        """
+        Return the messages to send to a provider with their positions.
+
+        Successive messages of the same role are joined into one message.
+
+        :param provider: str
+            name of the provider
+        :return: tuple
+            (messages, indexes), where indexes[i] is the position of
+            messages[i] in the conversation, which is given to
+            summarize(), or -1 for the summary
+        """
+        messages = []
+        indexes = []
+        with self._lock:
+            self._load()
+            items = list(self._messages)
+            offset = self._offset
+            if self.summary is not None:
+                messages = summary_messages(self.summary)
+                indexes = [-1] * len(messages)
+        i = 0
+        while i < len(items):
+            if items[i].provider is None:
+                _add(messages, indexes, items[i], offset + i)
+                i += 1
+                continue
+            # Answers in the turn
+            end = i
+            while end < len(items) and items[end].provider is not None:
+                end += 1
+            names = [item.provider for item in items[i:end]]
+            if provider in names:
+                chosen = provider
+            elif end < len(items):
+                chosen = names[0]
+            else:
+                # The current turn, which the provider is going to answer
+                chosen = None
+            for j in range(i, end):
+                if items[j].provider == chosen:
+                    _add(messages, indexes, items[j], offset + j)
+            i = end
+        return messages, indexes
+
+    def summarize(self, index, summary):
+        """
+        Replace the messages before a position with their summary.
+
+        :param index: int
+            position of the first message to keep, given by translate()
+        :param summary: str
+            summary of the earlier conversation, including the former summary
+        """
+        with self._lock:
+            self._load()
+            if index <= self._offset:
+                # Already summarized by another request
+                return
+            del self._messages[:index - self._offset]
+            self._offset = index
+            self.summary = summary
+            if self._store is not None:
+                self._store.summarize(self._session_id, index, summary)
+
+    def _load(self):
+        """
+        Read the messages from the session at the first call.
+        It is called with self._lock.
+        """
+        if self._loaded:
+            return
+        self._loaded = True
+        saved = self._store.load(self._session_id)
+        if saved is None:
+            return
+        self._offset, self.summary, rows = saved
+        self._messages = [Message(*row) for row in rows]
+
+
+def _add(messages, indexes, message, index):
+    """
+    Add a message, joining it to the last message of the same role.
+
+    :param messages: list
+        messages with "role" and "content"
+    :param indexes: list
+        positions of messages
+    :param message: Message
+        message to add
+    :param index: int
+        position of the message
+    """
+    if messages and messages[-1]['role'] == message.role:
+        separator = '\n\n' if message.role == 'user' else ''
+        messages[-1] = {"role": message.role,
+                        "content": messages[-1]['content'] + separator + message.content}
+        return
+    messages.append({"role": message.role, "content": message.content})
+    indexes.append(index)
@@ -0,0 +1,262 @@
+"""
+document - read documents and summarize them by chunks
+"""
+import concurrent.futures
+import os
+import sys
+from .cache import ResponseCache
+from .tokens import CHARS_PER_TOKEN, estimate_tokens
+
+__all__ = [
+    "read_document",
+    "read_documents",
+    "split_chunks",
+    "summarize_chunks",
+    "summarize_document",
+]
+
+
+def read_document(client, source, pages=None, max_chars=None):
+    """
+    Read text of a document.
+
+    :param client: Prompt
+        client used to retrieve URL
+    :param source: str
+        URL, path of a local file (PDF, HTML or text), or '-' for stdin
+    :param pages: tuple
+        (first, last) page numbers of PDF file, see retrieve_from_url()
+    :param max_chars: int
+        maximum number of characters of the text, or None for no limit
+    :return: str
+        text of the document
+    """
+    if source == '-':
+        text = sys.stdin.read()
+    elif os.path.isfile(source):
+        extension = os.path.splitext(source)[1].lower()
+        try:
+            if extension == '.pdf':
+                from .pdf import extract_pdf
+                return extract_pdf(source, pages=pages, max_chars=max_chars)
+            with open(source, encoding='utf-8', errors='replace') as f:
+                text = f.read()
+        except Exception as e:
+            print(e)
+            sys.exit(1)
+        if extension in ['.html', '.htm']:
+            import trafilatura
+            text = trafilatura.extract(text)
+            if text is None:
+                print(f'{source} could not be converted to text.')
+                sys.exit(1)
+    else:
+        return client.retrieve_from_url(
+            source, pages=pages, max_chars=max_chars)
+    if max_chars is not None:
+        text = text[:max_chars]
+    return text
+
+
+def read_documents(client, sources, pages=None, max_chars=None):
+    """
+    Read text of documents concurrently.
+
+    :param client: Prompt
+        client used to retrieve URL
+    :param sources: list
+        sources given to read_document()
+    :param pages: tuple
+        (first, last) page numbers of PDF file, see retrieve_from_url()
+    :param max_chars: int
+        maximum number of characters of the text of each document
+    :return: list
+        text of each document in the order of sources
+    """
+    if len(sources) == 1:
+        return [read_document(client, sources[0], pages, max_chars)]
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(sources)) as executor:
+        futures = [executor.submit(read_document, client, source,
+                                   pages, max_chars)
+                   for source in sources]
+        return [future.result() for future in futures]
+
+
+def split_chunks(text, max_tokens):
+    """
+    Split text into chunks of at most max_tokens tokens.
+
+    Text is split at paragraphs, then at lines, and then at characters
+    when a paragraph or a line is too long.
+
+    :param text: str
+        text to split
+    :param max_tokens: int
+        maximum number of tokens of a chunk, estimated by estimate_tokens()
+    :return: list
+        chunks of text
+    """
+    chunks = []
+    parts = []
+    tokens = 0
+    for paragraph in _split_pieces(text, max_tokens):
+        paragraph_tokens = estimate_tokens(paragraph)
+        if parts and tokens + paragraph_tokens > max_tokens:
+            chunks.append('\n\n'.join(parts))
+            parts = []
+            tokens = 0
+        parts.append(paragraph)
+        tokens += paragraph_tokens
+    if parts:
+        chunks.append('\n\n'.join(parts))
+    return chunks
+
+
+def summarize_document(client, text, max_tokens, prompt, concurrency=4,
+                       cache=None, verbose=True):
+    """
+    Summarize a long text by chunks until it fits in max_tokens.
+
+    Text is split into chunks, and the chunks are summarized concurrently
+    (map). The joined summaries are used as the text, and when it is
+    still too long, the same process is repeated (reduce).
+
+    :param client: Prompt
+        client whose settings are used
+    :param text: str
+        text to summarize
+    :param max_tokens: int
+        maximum number of tokens of a chunk and of the result
+    :param prompt: str
+        prompt to summarize a chunk
+    :param concurrency: int
+        maximum number of requests at once
+    :param cache: ResponseCache
+        cache of summaries, or None not to cache
+    :param verbose: boolean
+        whether to print progress
+    :return: str
+        text if it fits in max_tokens, otherwise joined summaries
+    """
+    chunks = split_chunks(text, max_tokens)
+    while len(chunks) > 1:
+        summaries = summarize_chunks(
+            client, chunks, prompt, concurrency=concurrency,
+            cache=cache, verbose=verbose)
+        text = '\n\n'.join(summaries)
+        next_chunks = split_chunks(text, max_tokens)
+        if len(next_chunks) >= len(chunks):
+            # Summaries are not shorter than the chunks.
+            break
+        chunks = next_chunks
+    return text
+
+
+def summarize_chunks(client, chunks, prompt, concurrency=4,
+                     cache=None, verbose=True):
+    """
+    Summarize chunks concurrently.
+
+    Each chunk is asked with prompt to client.ai_provider without chat
+    history. Summaries are cached with the provider, model, prompt and
+    chunk as a key, so that only changed chunks are asked again.
+
+    :param client: Prompt
+        client whose settings are used
+    :param chunks: list
+        chunks returned by split_chunks()
+    :param prompt: str
+        prompt to summarize a chunk
+    :param concurrency: int
+        maximum number of requests at once
+    :param cache: ResponseCache
+        cache of summaries, or None not to cache
+    :param verbose: boolean
+        whether to print progress
+    :return: list
+        summaries of chunks in the order of chunks
+    """
+    provider = client.ai_provider
+    model = getattr(client, 'model_' + provider.name.lower())
+    keys = [ResponseCache.key(provider=provider.name.lower(), model=model,
+                              prompt=prompt, chunk=chunk)
+            for chunk in chunks]
+    summaries = [None] * len(chunks)
+    if cache is not None:
+        for i, key in enumerate(keys):
+            cached = cache.get(key)
+            if cached is not None:
+                summaries[i] = cached[0]
+    done = sum(summary is not None for summary in summaries)
+    if verbose:
+        print(f'Summarizing {done}/{len(chunks)}\r', end='')
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=concurrency) as executor:
+        futures = {executor.submit(_summarize, client, chunk, prompt): i
+                   for i, chunk in enumerate(chunks) if summaries[i] is None}
+        for future in concurrent.futures.as_completed(futures):
+            i = futures[future]
+            job, summary = future.result()
+            if job.error:
+                print(f'{client.color("Error message")}> {summary}')
+                executor.shutdown(cancel_futures=True)
+                sys.exit(1)
+            summaries[i] = summary
+            if cache is not None:
+                cache.put(keys[i], summary, job.finish_reason)
+            done += 1
+            if verbose:
+                print(f'Summarizing {done}/{len(chunks)}\r', end='')
+    if verbose:
+        print(' ' * 50 + '\r', end='')
+    return summaries
+
+
+def _summarize(client, chunk, prompt):
+    """
+    Summarize a chunk without chat history.
+
+    :param client: Prompt
+        client whose settings are used
+    :param chunk: str
+        chunk of text
+    :param prompt: str
+        prompt to summarize a chunk
+    :return: tuple
+        (copied client, summary)
+    """
+    job = client._fork(client.ai_provider)
+    job.clear()
+    return job, str(job.ask(prompt + '\n\n' + chunk))
+
+
+def _split_pieces(text, max_tokens):
+    """
+    Split text into paragraphs each of which has at most max_tokens tokens.
+
+    :param text: str
+        text to split
+    :param max_tokens: int
+        maximum number of tokens
+    :return: generator
+        pieces of text
+    """
+    for paragraph in text.split('\n\n'):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= max_tokens:
+            yield paragraph
+            continue
+        for line in paragraph.split('\n'):
+            while estimate_tokens(line) > max_tokens:
+                # Shorten until it fits, as CJK text has more tokens
+                # per character than ASCII text.
+                size = max_tokens * CHARS_PER_TOKEN
+                while size > 1 and estimate_tokens(line[:size]) > max_tokens:
+                    size //= 2
+                yield line[:size]
+                line = line[size:]
+            if line.strip():
+                yield line
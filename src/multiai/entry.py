@@ -1,18 +1,12 @@
 """
 Entry point of multiai
 """
-import argparse
-import configparser
 import os
-import readline
-import subprocess
 import sys
-import webbrowser
-from datetime import datetime
-from .multiai import Prompt, Provider
 
 __all__ = [
     "entry",
+    "main",
 ]
 
 
@@ -20,68 +14,151 @@ def entry():
     """
     Entry point of multiai
 
-    to be invoked with ai command
+    to be invoked with ai command. When multiai server is running, the
+    command is run by the server, which has already loaded the settings
+    and the SDKs, otherwise it is run in this process.
     """
-    client = Prompt()
-    # Load user setting from config file in the order of
-    # data/system.ini, ~/.multiai, .multiai
-    inifile = configparser.ConfigParser()
-    here = os.path.abspath(os.path.dirname(__file__))
-    inifile.read(os.path.join(here, 'data/system.ini'))
-    inifile.read(os.path.expanduser('~/.multiai'))
-    inifile.read('.multiai')
+    # Only the standard library is loaded until the command is run here.
+    from .forward import run_command
+    status = run_command(sys.argv[1:])
+    if status is not None:
+        sys.exit(status)
+    main(sys.argv[1:])
+
+
+def main(argv, client=None, check=None, prog=None):
+    """
+    Run ai command.
+
+    :param argv: list
+        command-line arguments
+    :param client: Prompt
+        client to run the command with. Default is a new Prompt.
+    :param check: function
+        function called with the parsed arguments and the client before
+        running the command, which can raise an exception to stop it
+    :param prog: str
+        name of the command in the help. Default is from sys.argv[0].
+    """
+    import argparse
+    import readline
+    from datetime import datetime
+    from .batch import read_prompts, run_batch
+    from .cache import ResponseCache
+    from .document import read_documents, summarize_document
+    from .multiai import Prompt, Provider
+    if client is None:
+        client = Prompt()
+    # Settings read by Prompt from data/system.ini, ~/.multiai, .multiai
+    settings = client.settings
     # Start reading [command] section of the config file
     # log_file: file name of the log file.
-    log_file = inifile.get('command', 'log_file')
+    log_file = settings.get('command', 'log_file')
     log_file = os.path.expanduser(log_file)
     log_file = log_file.replace('DATE', datetime.today().strftime('%Y%m%d'))
     client.log_file = log_file
     # user_agent: user agent when retrieving web data
-    client.user_agent = inifile.get('command', 'user_agent', fallback=None)
+    client.user_agent = settings.get('command', 'user_agent', fallback=None)
     # [promot] section
-    prompt_english = inifile.get('prompt', 'english')
-    prompt_factual = inifile.get('prompt', 'factual')
-    prompt_url = inifile.get('prompt', 'url')
+    prompt_english = settings.get('prompt', 'english')
+    prompt_factual = settings.get('prompt', 'factual')
+    prompt_url = settings.get('prompt', 'url')
+    # [batch] section
+    batch_concurrency = settings.getint('batch', 'concurrency')
+    # [document] section
+    chunk_tokens = settings.getint('document', 'chunk_tokens')
+    chunk_prompt = settings.get('document', 'chunk_prompt')
+    chunk_concurrency = settings.getint('document', 'concurrency')
+    chunk_cache = None
+    if settings.getboolean('document', 'cache_enabled'):
+        chunk_cache = settings.get('document', 'cache')
     # Load commandline argument
     parser = argparse.ArgumentParser(
+        prog=prog,
         description=f'multiai {client.version} - {client.description}')
     parser.add_argument('prompt', nargs='*',
                         help='prompt for AI')
     parser.add_argument('-d', '--document',
                         action='store_true', help='open document page and exit')
+    # Short options of other arguments
+    # -c and -l are kept even when always_copy or always_log hides them.
+    short_options = {'-h', '-d', '-m', '-t', '-e', '-f', '-u', '-s', '-c', '-l'}
     for provider in Provider:
         name = provider.name.lower()
         help = 'use ' + name
         if client.ai_provider == provider:
             help += ' (Default)'
-        parser.add_argument(
-            '-' + name.replace('m', '')[0],
-            '--' + name,
-            action='store_true',
-            help=help)
+        options = ['--' + name]
+        # Only the long option is given when the short one is taken
+        short_option = '-' + name.replace('m', '')[0]
+        if short_option not in short_options:
+            short_options.add(short_option)
+            options.insert(0, short_option)
+        parser.add_argument(*options, action='store_true', help=help)
     parser.add_argument('-m', '--model',
                         help='set model')
+    parser.add_argument('--fallback', metavar='PROVIDERS',
+                        help='providers to ask in order when the provider fails, such as anthropic,google')
+    parser.add_argument('--hedge', action='store_true',
+                        help='also ask the next fallback provider when the answer is slow, and take the first answer')
     parser.add_argument('-t', '--temperature',
                         help=f'set temperature. 0 is deterministic. Default is {client.temperature}.')
     parser.add_argument('-e', '--english',
                         action='store_true', help='correct if English, translate into English otherwise')
     parser.add_argument('-f', '--factual',
                         action='store_true', help='factual information')
-    parser.add_argument('-u', '--url',
-                        help='retrieve text from the URL')
+    parser.add_argument('-u', '--url', action='append',
+                        help='retrieve text from the URL or local file (PDF, HTML or text). Use - for stdin. Can be given more than once')
+    parser.add_argument('--pages', metavar='FIRST-LAST',
+                        help='pages of PDF to retrieve with -u, such as 3, 1-10 or 5-')
+    parser.add_argument('--max-chars', type=int,
+                        help='maximum number of characters to retrieve with -u')
+    parser.add_argument('-s', '--stream',
+                        action='store_true', help='show the answer as it arrives')
+    parser.add_argument('--stats', action='store_true',
+                        help='show time, tokens and cost of each answer')
+    parser.add_argument('--resume', metavar='ID', nargs='?', const='',
+                        help='resume the saved session ID. The last session when ID is omitted')
+    parser.add_argument('--save', action='store_true',
+                        help='save the conversation as a session to resume')
+    parser.add_argument('--sessions', action='store_true',
+                        help='list saved sessions and exit')
+    parser.add_argument('--serve', action='store_true',
+                        help='run multiai server with HTTP/JSON API at the address in [server] section')
+    parser.add_argument('--batch', metavar='FILE',
+                        help='ask prompts in FILE (one per line, text or JSON) and write answers as JSON lines. Use - for stdin')
+    parser.add_argument('--output', metavar='FILE', default='-',
+                        help='output file of --batch. Answered prompts in FILE are skipped. Default is stdout')
+    parser.add_argument('--concurrency', type=int, default=batch_concurrency,
+                        help=f'maximum number of requests at once for each provider in --batch. Default is {batch_concurrency}')
+    parser.add_argument('--order', choices=['input', 'completion'], default='input',
+                        help='order of answers in --batch. Default is input')
     if not client.always_copy:
         parser.add_argument('-c', '--copy',
                             action='store_true', help='copy the latest answer')
     if not client.always_log:
         parser.add_argument('-l', '--log',
                             action='store_true', help=f'save log as {log_file}')
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if check is not None:
+        check(args, client)
     # Get prompt
     prompt = ' '.join(args.prompt)
     # -d option
     if args.document:
+        import webbrowser
         webbrowser.open(client.url)
         sys.exit()
+    # --sessions option
+    if args.sessions:
+        if client.sessions is None:
+            print('Session file is not set in [session] section.')
+            sys.exit(1)
+        for session_id, updated, count, first in client.sessions.recent():
+            updated = datetime.fromtimestamp(updated).strftime('%Y-%m-%d %H:%M')
+            first = (first or '').split('\n')[0][:50]
+            print(f'{session_id}  {updated}  {count:4d}  {first}')
+        sys.exit()
     # Set ai_provider, ai_providers and model
     client.ai_providers = []
     for provider in Provider:
@@ -95,6 +172,11 @@ def entry():
         if args.model:
             setattr(client, default_model, args.model)
         client.model = getattr(client, default_model, None)
+    # --fallback and --hedge options
+    if args.fallback:
+        client.set_fallback(args.fallback)
+    if args.hedge:
+        client.hedge = True
     # -t option
     if args.temperature:
         try:
@@ -105,6 +187,10 @@ def entry():
         if client.temperature < 0:
             print("Invalid 'temperature': should be >=0.")
             sys.exit(1)
+    # -s option
+    client.stream = args.stream
+    # --stats option
+    client.stats = args.stats
     # -c option
     if client.always_copy:
         args.copy = True
@@ -128,13 +214,74 @@ def entry():
         pre_prompt = prompt_english + '\n\n'
     if args.factual:
         pre_prompt = prompt_factual + '\n'
+    # --serve option
+    if args.serve:
+        from .server import Server
+        server = Server(client, session_ttl=settings.getfloat('server', 'session_ttl'))
+        server.serve(host=settings.get('server', 'host'),
+                     port=settings.getint('server', 'port'),
+                     socket_path=settings.get('server', 'socket') or None)
+        sys.exit()
+    # --batch option
+    if args.batch:
+        if args.concurrency < 1:
+            print("Invalid 'concurrency': should be >=1.")
+            sys.exit(1)
+        try:
+            if args.batch == '-':
+                f = sys.stdin
+            else:
+                f = open(args.batch)
+            with f:
+                run_batch(client, read_prompts(f), args.output,
+                          concurrency=args.concurrency, order=args.order,
+                          pre_prompt=pre_prompt)
+        except OSError as e:
+            print(e)
+            sys.exit(1)
+        sys.exit()
+    # --resume option
+    if args.resume is not None:
+        client.load_session(args.resume or None)
+        print(f'Resumed session {client.session_id}')
+    elif args.save or (client.autosave and client.sessions is not None):
+        client.save_session()
+        if args.save:
+            print(f'Saved session {client.session_id}')
     # -u option
     if args.url:
-        text = client.retrieve_from_url(args.url)
+        pages = None
+        if args.pages:
+            try:
+                first, dash, last = args.pages.partition('-')
+                if not dash:
+                    last = first
+                pages = (int(first), int(last) if last else None)
+            except ValueError:
+                print("Invalid 'pages': should be like 1-10 or 5-.")
+                sys.exit(1)
+        texts = read_documents(
+            client, args.url, pages=pages, max_chars=args.max_chars)
+        if len(args.url) == 1:
+            text = texts[0]
+        else:
+            text = '\n\n'.join(f'Text of {url}:\n{text}'
+                               for url, text in zip(args.url, texts))
+        # Long text is summarized by chunks.
+        cache = None
+        if chunk_cache:
+            cache = ResponseCache(
+                chunk_cache,
+                ttl=settings.getfloat('document', 'cache_ttl_days') * 86400,
+                max_entries=settings.getint('document', 'cache_max_entries'))
+        text = summarize_document(
+            client, text, chunk_tokens, chunk_prompt,
+            concurrency=chunk_concurrency, cache=cache)
         if prompt == '':
             prompt = prompt_url
-        print(f'{client.color(client.role)}> {prompt}\n\nText of {args.url}')
-        prompt_summary = f'{prompt_url}\n\nText of {args.url}'
+        urls = ', '.join(args.url)
+        print(f'{client.color(client.role)}> {prompt}\n\nText of {urls}')
+        prompt_summary = f'{prompt_url}\n\nText of {urls}'
         prompt += '\n' + text
         client.ask_print(prompt, prompt_summary=prompt_summary)
     # Finished loading arguments and run
@@ -0,0 +1,158 @@
+"""
+forward - thin client running ai command by multiai server
+
+When multiai server is listening to the Unix socket in [server] section,
+ai command sends its arguments to the server, which has already loaded
+the settings and the SDKs, and shows the output sent back. Only a few
+modules of the standard library are loaded, and HTTP is spoken directly
+on the socket, so that the command starts quickly.
+"""
+import io
+import json
+import os
+import socket
+import sys
+
+__all__ = [
+    "run_command",
+]
+
+
+class _ServerError(Exception):
+    """
+    Failure of the server to run the command.
+    """
+
+
+def run_command(argv):
+    """
+    Run ai command by the server. stdin is read only when the command
+    needs it.
+
+    :param argv: list
+        command-line arguments
+    :return: int or None
+        exit status, or None when the command should be run in this
+        process because the server is not running or cannot run it
+    """
+    # Shared with the command when it is run in this process.
+    from .settings import load_settings
+    settings = load_settings()
+    path = settings.get('server', 'socket')
+    if not path or not settings.getboolean('server', 'forward'):
+        return None
+    path = os.path.expanduser(path)
+    if not os.path.exists(path):
+        return None
+    stdin = None
+    shown = False
+    try:
+        while True:
+            result = None
+            for item in _post(path, '/run', {
+                'prog': os.path.basename(sys.argv[0]),
+                'argv': argv,
+                'cwd': os.getcwd(),
+                'stdin': stdin,
+                'stdin_tty': _isatty(sys.stdin),
+                'stdout_tty': _isatty(sys.stdout),
+                'stderr_tty': _isatty(sys.stderr),
+            }):
+                if 'out' in item:
+                    sys.stdout.write(item['out'])
+                    sys.stdout.flush()
+                    shown = True
+                elif 'err' in item:
+                    sys.stderr.write(item['err'])
+                    sys.stderr.flush()
+                    shown = True
+                elif 'page' in item:
+                    from .printlong import print_long
+                    print_long(item['page'])
+                    shown = True
+                else:
+                    result = item
+            if result is None:
+                raise _ServerError('connection is closed.')
+            if 'exit' in result:
+                return result['exit']
+            if 'stdin' not in result or stdin is not None:
+                return _run_locally(stdin)
+            stdin = sys.stdin.read() if sys.stdin is not None else ''
+    except (_ServerError, OSError, ValueError) as e:
+        if shown:
+            print(f'multiai server: {e}', file=sys.stderr)
+            return 1
+        # The server is stopped or too old.
+        return _run_locally(stdin)
+
+
+def _post(path, route, body):
+    """
+    Send a request to the server and yield its JSON lines as they arrive.
+
+    :param path: str
+        path of the Unix socket
+    :param route: str
+        path of the API
+    :param body: dict
+        JSON body
+    :return: generator
+        JSON lines of the response
+    """
+    data = json.dumps(body).encode()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(
+            f'POST {route} HTTP/1.1\r\nHost: localhost\r\n'
+            f'Content-Type: application/json\r\nContent-Length: {len(data)}\r\n'
+            'Connection: close\r\n\r\n'.encode() + data)
+        with sock.makefile('rb') as f:
+            status = f.readline().split()
+            if len(status) < 2 or status[1] != b'200':
+                raise _ServerError(b' '.join(status[1:]).decode(errors='replace'))
+            chunked = False
+            while True:
+                header = f.readline()
+                if header in (b'\r\n', b''):
+                    break
+                name, _, value = header.partition(b':')
+                if name.strip().lower() == b'transfer-encoding':
+                    chunked = value.strip().lower() == b'chunked'
+            if not chunked:
+                raise _ServerError('response is not JSON lines.')
+            buffer = b''
+            while True:
+                size = int(f.readline().split(b';')[0], 16)
+                if size == 0:
+                    break
+                buffer += f.read(size)
+                f.readline()
+                *lines, buffer = buffer.split(b'\n')
+                for line in lines:
+                    yield json.loads(line)
+
+
+def _run_locally(stdin):
+    """
+    Prepare to run the command in this process.
+
+    :param stdin: str
+        text of stdin already read, or None
+    :return: None
+    """
+    if stdin is not None:
+        sys.stdin = io.StringIO(stdin)
+    return None
+
+
+def _isatty(stream):
+    """
+    Check whether a stream is a terminal.
+
+    :param stream: file object
+        stream, which can be None
+    :return: boolean
+        True for a terminal
+    """
+    return stream is not None and stream.isatty()
@@ -0,0 +1,142 @@
+"""
+history - keep chat history within a limit
+"""
+from .tokens import estimate_tokens
+
+__all__ = [
+    "POLICIES",
+    "compact_history",
+    "history_tokens",
+    "summary_messages",
+]
+
+# none: send the whole history
+# window: send the last max_turns turns
+# tokens: send the last turns within max_tokens
+# summarize: summarize older turns when history exceeds max_tokens
+POLICIES = ['none', 'window', 'tokens', 'summarize']
+
+# Tokens added to each message for its role and separators
+MESSAGE_TOKENS = 4
+
+
+def history_tokens(messages):
+    """
+    Estimate the number of tokens of messages.
+
+    :param messages: list
+        messages with "role" and "content"
+    :return: int
+        estimated number of tokens
+    """
+    return sum(estimate_tokens(message['content']) + MESSAGE_TOKENS
+               for message in messages)
+
+
+def compact_history(messages, policy, max_turns=None, max_tokens=None,
+                    summarize=None):
+    """
+    Return messages within the limit of the policy.
+
+    The new prompt, which is the last message of user, and the partial
+    answer following it when the answer is continued, are always kept,
+    and the returned messages start with a message of user.
+
+    :param messages: list
+        messages with "role" and "content", oldest first
+    :param policy: str
+        one of POLICIES
+    :param max_turns: int
+        maximum number of previous turns (a question and an answer)
+        for window policy
+    :param max_tokens: int
+        maximum number of tokens for tokens and summarize policies
+    :param summarize: function
+        function which takes older messages and returns their summary,
+        or None when it fails. Used by summarize policy.
+    :return: list
+        messages to send
+    """
+    if policy == 'none' or not messages:
+        return messages
+    if policy == 'window':
+        return _start_with_user(messages[max(_last_prompt(messages) - 2 * max_turns, 0):])
+    if policy == 'tokens' or history_tokens(messages) <= max_tokens:
+        return _start_with_user(_last_messages(messages, max_tokens))
+    # Summarize older messages and keep recent ones in half of max_tokens
+    recent = _start_with_user(_last_messages(messages, max_tokens // 2))
+    older = messages[:len(messages) - len(recent)]
+    summary = summarize(older) if older else None
+    if summary is None:
+        return _start_with_user(_last_messages(messages, max_tokens))
+    return summary_messages(summary) + recent
+
+
+def summary_messages(summary):
+    """
+    Return messages which give the summary of the earlier conversation.
+
+    :param summary: str
+        summary of the earlier conversation
+    :return: list
+        a message of user with the summary and an answer to it
+    """
+    return [
+        {"role": "user",
+         "content": f'Summary of the earlier conversation:\n{summary}'},
+        {"role": "assistant", "content": 'OK.'},
+    ]
+
+
+def _last_messages(messages, max_tokens):
+    """
+    Return the last messages within max_tokens.
+
+    :param messages: list
+        messages
+    :param max_tokens: int
+        maximum number of tokens
+    :return: list
+        last messages, including those from the new prompt even when they
+        exceed
+    """
+    prompt = _last_prompt(messages)
+    tokens = 0
+    start = len(messages) - 1
+    for i in range(len(messages) - 1, -1, -1):
+        tokens += history_tokens(messages[i:i + 1])
+        if tokens > max_tokens and i < prompt:
+            break
+        start = i
+    return messages[start:]
+
+
+def _last_prompt(messages):
+    """
+    Return the index of the new prompt.
+
+    :param messages: list
+        messages
+    :return: int
+        index of the last message of user, or of the last message when
+        there is no message of user
+    """
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i]['role'] == 'user':
+            return i
+    return len(messages) - 1
+
+
+def _start_with_user(messages):
+    """
+    Remove messages before the first message of user.
+
+    :param messages: list
+        messages
+    :return: list
+        messages starting with a message of user
+    """
+    for i, message in enumerate(messages):
+        if message['role'] == 'user':
+            return messages[i:]
+    return messages[-1:]
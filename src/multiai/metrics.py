@@ -0,0 +1,88 @@
+"""
+metrics - latency, tokens and cost of questions to AI
+"""
+import json
+import os
+import threading
+
+__all__ = [
+    "completion_usage",
+    "format_metrics",
+    "write_metrics",
+]
+
+_write_lock = threading.Lock()
+
+
+def completion_usage(completion):
+    """
+    Read token usage from a response of a provider.
+
+    :param completion: object
+        response returned by the SDK of a provider, or a chunk of a
+        streamed response
+    :return: tuple or None
+        (input tokens, output tokens), or None when it is not given
+    """
+    usage = getattr(completion, 'usage', None)
+    if usage is not None:
+        # OpenAI, Perplexity and Mistral, and then Anthropic
+        for names in [('prompt_tokens', 'completion_tokens'),
+                      ('input_tokens', 'output_tokens')]:
+            input_tokens = getattr(usage, names[0], None)
+            output_tokens = getattr(usage, names[1], None)
+            if input_tokens is not None and output_tokens is not None:
+                return input_tokens, output_tokens
+    # Google
+    usage = getattr(completion, 'usage_metadata', None)
+    if usage is not None:
+        input_tokens = getattr(usage, 'prompt_token_count', None)
+        output_tokens = getattr(usage, 'candidates_token_count', None)
+        if input_tokens is not None and output_tokens is not None:
+            return input_tokens, output_tokens
+    return None
+
+
+def format_metrics(metrics):
+    """
+    Format metrics of a question in a line.
+
+    :param metrics: dict
+        metrics made by Prompt
+    :return: str
+        line to show
+    """
+    items = [metrics['model'], f'{metrics["seconds"]:.2f} s']
+    if metrics['first_token_seconds'] is not None:
+        items.append(f'first token {metrics["first_token_seconds"]:.2f} s')
+    tokens = f'{metrics["input_tokens"]} in / {metrics["output_tokens"]} out tokens'
+    if metrics['estimated_tokens']:
+        tokens += ' (estimated)'
+    items.append(tokens)
+    requests = f'{metrics["requests"]} request{"s" if metrics["requests"] != 1 else ""}'
+    if metrics['cached_requests']:
+        requests += f' ({metrics["cached_requests"]} cached)'
+    if metrics['retries']:
+        requests += f', {metrics["retries"]} retries'
+    items.append(requests)
+    if metrics['cost'] is not None:
+        items.append(f'${metrics["cost"]:.6f}')
+    if metrics['error']:
+        items.append('error')
+    return ', '.join(items)
+
+
+def write_metrics(file, metrics):
+    """
+    Append metrics of a question to a JSON lines file.
+
+    :param file: str
+        metrics file
+    :param metrics: dict
+        metrics made by Prompt
+    """
+    file = os.path.expanduser(file)
+    line = json.dumps(metrics, ensure_ascii=False) + '\n'
+    with _write_lock:
+        with open(file, mode='a') as f:
+            f.write(line)
@@ -0,0 +1,215 @@
+"""
+mock - AI provider answering without network, for tests and benchmarks
+"""
+import random
+import time
+
+__all__ = [
+    "MockError",
+    "MockModel",
+]
+
+# Words of answers. Each word is counted as a token.
+WORDS = ['mock', 'answer', 'of', 'multiai', 'for', 'tests', 'and',
+         'benchmarks']
+
+
+class MockError(Exception):
+    """
+    Error injected by MockModel, which looks like an HTTP error of SDKs.
+    """
+
+    def __init__(self, status_code, retry_after=None):
+        """
+        :param status_code: int
+            HTTP status code
+        :param retry_after: float
+            value of Retry-After header, or None
+        """
+        super().__init__(f'Error {status_code}: injected by mock provider')
+        self.status_code = status_code
+        self.message = str(self)
+        headers = {}
+        if retry_after is not None:
+            headers['retry-after'] = str(retry_after)
+        self.response = _Response(headers)
+
+
+class MockModel():
+    """
+    Model which makes an answer after a given latency at a given rate.
+
+    Usage:
+        model = MockModel(latency=0.5, tokens_per_second=50)
+        completion = model.complete(messages)
+        print(completion.text, completion.finish_reason)
+    """
+
+    def __init__(self, latency=0, tokens_per_second=0, answer_tokens=100,
+                 finish_reasons=(), error_rate=0, error_status=429,
+                 retry_after=None):
+        """
+        :param latency: float
+            seconds until the first token
+        :param tokens_per_second: float
+            rate of making tokens, or 0 to make them at once
+        :param answer_tokens: int
+            number of tokens of an answer
+        :param finish_reasons: tuple
+            finish reasons of the 1st, 2nd, ... requests of a question,
+            and the last one is used for the following requests. When it
+            is empty, 'length' is used if the answer is cut by max_tokens,
+            otherwise 'stop'.
+        :param error_rate: float
+            probability of an error for each request
+        :param error_status: int
+            HTTP status code of the error
+        :param retry_after: float
+            Retry-After header of the error, or None
+        """
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.finish_reasons = tuple(finish_reasons)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+
+    def complete(self, messages, request=1, max_tokens=None):
+        """
+        Make an answer.
+
+        :param messages: list
+            messages with "role" and "content"
+        :param request: int
+            number of the request in the question, starting from 1
+        :param max_tokens: int
+            maximum number of tokens of the answer, or None
+        :return: MockCompletion
+            answer
+        """
+        words, completion = self._prepare(messages, request, max_tokens)
+        seconds = self.latency + self._seconds(len(words))
+        if seconds:
+            time.sleep(seconds)
+        return completion
+
+    async def complete_async(self, messages, request=1, max_tokens=None):
+        """
+        Make an answer asynchronously.
+
+        :param messages: list
+            messages with "role" and "content"
+        :param request: int
+            number of the request in the question, starting from 1
+        :param max_tokens: int
+            maximum number of tokens of the answer, or None
+        :return: MockCompletion
+            answer
+        """
+        import asyncio
+        words, completion = self._prepare(messages, request, max_tokens)
+        await asyncio.sleep(self.latency + self._seconds(len(words)))
+        return completion
+
+    def stream(self, messages, request=1, max_tokens=None):
+        """
+        Make an answer and yield it word by word.
+
+        :param messages: list
+            messages with "role" and "content"
+        :param request: int
+            number of the request in the question, starting from 1
+        :param max_tokens: int
+            maximum number of tokens of the answer, or None
+        :return: generator
+            words of the answer, and the answer (MockCompletion) is
+            returned at the end
+        """
+        words, completion = self._prepare(messages, request, max_tokens)
+        if self.latency:
+            time.sleep(self.latency)
+        for word in words:
+            seconds = self._seconds(1)
+            if seconds:
+                time.sleep(seconds)
+            yield word
+        return completion
+
+    def _prepare(self, messages, request, max_tokens):
+        """
+        Make words and the completion of an answer, or raise an error.
+
+        :param messages: list
+            messages with "role" and "content"
+        :param request: int
+            number of the request in the question
+        :param max_tokens: int
+            maximum number of tokens of the answer, or None
+        :return: tuple
+            (words, MockCompletion)
+        """
+        if self.error_rate and random.random() < self.error_rate:
+            if self.latency:
+                time.sleep(self.latency)
+            raise MockError(self.error_status, self.retry_after)
+        tokens = self.answer_tokens
+        if max_tokens is not None and max_tokens < tokens:
+            tokens = max_tokens
+        # A continued answer follows the former part after a space
+        words = [('' if i == 0 and request == 1 else ' ') + WORDS[i % len(WORDS)]
+                 for i in range(tokens)]
+        if self.finish_reasons:
+            finish_reason = self.finish_reasons[
+                min(request, len(self.finish_reasons)) - 1]
+        elif tokens < self.answer_tokens:
+            finish_reason = 'length'
+        else:
+            finish_reason = 'stop'
+        input_tokens = sum(len(message['content'].split())
+                           for message in messages)
+        return words, MockCompletion(
+            ''.join(words), finish_reason, input_tokens, tokens)
+
+    def _seconds(self, tokens):
+        """
+        Return time to make tokens.
+
+        :param tokens: int
+            number of tokens
+        :return: float
+            seconds
+        """
+        if not self.tokens_per_second:
+            return 0
+        return tokens / self.tokens_per_second
+
+
+class MockCompletion():
+    """
+    Answer of MockModel.
+    """
+
+    def __init__(self, text, finish_reason, input_tokens, output_tokens):
+        self.text = text
+        self.finish_reason = finish_reason
+        self.usage = _Usage(input_tokens, output_tokens)
+
+
+class _Usage():
+    """
+    Token usage of MockCompletion.
+    """
+
+    def __init__(self, input_tokens, output_tokens):
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+
+
+class _Response():
+    """
+    HTTP response of MockError.
+    """
+
+    def __init__(self, headers):
+        self.headers = headers
@@ -1,22 +1,35 @@
 """
 multiai - A Python library for text-based AI interactions
+
+SDKs of providers and libraries for optional features are imported
+where they are used, so that only the SDK of the selected provider is
+loaded.
 """
-import anthropic
-import configparser
+import concurrent.futures
+import copy
 import enum
-import google.generativeai as genai
+import functools
+import importlib.metadata
 import json
-import openai
 import os
-import mistralai
-import pkg_resources
-import PyPDF2
-import pyperclip
-import requests
+import queue
+import random
 import sys
-import trafilatura
-from io import BytesIO
+import threading
+import time
+import typing
+from .cache import PageCache, ResponseCache
+from .conversation import Conversation
+from .history import POLICIES, compact_history, history_tokens
+from .metrics import completion_usage, format_metrics, write_metrics
 from .printlong import print_long
+from .ratelimit import error_status, get_limiter
+from .registry import BUILTIN_PROVIDERS, Backend, load_backend, provider_names
+from .routing import (acquire_replica, latency_percentile, record_latency,
+                      release_replica)
+from .session import SessionStore
+from .settings import load_settings
+from .tokens import estimate_tokens
 
 __all__ = [
     "Prompt",
@@ -24,6 +37,10 @@ __all__ = [
     "ColorCode",
 ]
 
+# API key given to genai.configure(), which is shared in the process
+_google_api_key = None
+_google_lock = threading.Lock()
+
 
 class Prompt():
     """
@@ -34,70 +51,75 @@ class Prompt():
         answer = client.ask(prompt)
     """
 
-    def __init__(self):
+    def __init__(self, settings=None):
+        """
+        :param settings: Settings
+            settings to use. Default is the settings read from the
+            settings files by load_settings().
+        """
         # Values independent of system or user setting file
         self.role = 'user'
         # Anthropic requires max_tokens, so default value is given.
         # It can be overwritten by max_tokens.
         self.max_tokens_anthropic = 4096
+        self.perplexity_base_url = 'https://api.perplexity.ai'
         self.ai_providers = []
-        # Load package data
-        distribution = pkg_resources.get_distribution('multiai')
-        self.version = distribution.version
-        metadata = distribution.get_metadata(distribution.PKG_INFO)
-        for line in metadata.splitlines():
-            if line.startswith('Summary:'):
-                self.description = line.split(':', 1)[1].strip()
-            elif line.startswith('Project-URL: Homepage,'):
-                self.url = line.split(', ', 1)[1].strip()
+        self.stream = False
+        # Whether the prompt of the next request is already added to the
+        # conversation, which is shared by providers asked at once
+        self._shared_prompt = False
+        # Set when the answer of another provider is taken by hedging
+        self._cancelled = False
+        # Functions called with the metrics of each question
+        self.hooks = []
+        self.metrics = None
+        self.stats = False
+        # SDK clients are kept for reuse to keep their connection pools.
+        self._clients = {}
+        self._clients_lock = threading.Lock()
         # Load user setting from config file in the order of
         # data/system.ini, ~/.multiai, .multai
         # It overwrites the system default values
-        inifile = configparser.ConfigParser()
-        here = os.path.abspath(os.path.dirname(__file__))
-        inifile.read(os.path.join(here, 'data/system.ini'))
-        conf_file = os.path.expanduser('~/.multiai')
-        inifile.read(conf_file)
-        inifile.read('.multiai')
-        self.set_provider(inifile.get('model', 'ai_provider'))
-        for provider in Provider:
-            name = provider.name.lower()
-            model = inifile.get('model', name, fallback=None)
-            if model is None:
-                print(f'multiai system error: {name} not found in [model].')
-                sys.exit(1)
-            setattr(self, 'model_' + name, model)
-        self.temperature = inifile.getfloat('default', 'temperature')
-        self.max_requests = inifile.getint('default', 'max_requests')
-        self.blank_lines = inifile.getint('command', 'blank_lines')
-        prompt_color = inifile.get('prompt', 'color')
-        self.always_copy = inifile.getboolean('command', 'always_copy')
+        if settings is None:
+            settings = load_settings()
+        self.settings = settings
+        # Values are converted once for each settings.
+        for name, value in settings.typed(_typed_settings).items():
+            # Lists and dicts are copied to be changed for this client.
+            if isinstance(value, (list, dict)):
+                value = value.copy()
+            setattr(self, name, value)
         self.copy = self.always_copy
-        self.always_log = inifile.getboolean('command', 'always_copy')
         self.log = self.always_log
-        try:
-            self.prompt_color = ColorCode[prompt_color.upper()].value
-        except Exception:
-            print(f'Error in the settings file: color = {prompt_color}')
-            available_colors = [name.lower()
-                                for name in ColorCode.__members__.keys()]
-            print(f'Available colors: {", ".join(available_colors)}')
-            sys.exit(1)
-        # No system default value is given from here.
-        # Default values are given by fallback values.
-        self.max_tokens = inifile.getint(
-            'default', 'max_tokens', fallback=None)
+        self.session_id = None
+        # API keys of environment variables are used before the settings.
         for provider in Provider:
             env = os.getenv(provider.name + '_API_KEY')
-            name = provider.name.lower()
-            key = name + '_api_key'
-            if env is None:
-                ini = inifile.get('api_key', name, fallback=None)
-                setattr(self, key, ini)
-            else:
-                setattr(self, key, env)
+            if env is not None:
+                setattr(self, provider.name.lower() + '_api_key', env)
         self.clear()
 
+    @property
+    def version(self):
+        """
+        Version of multiai
+        """
+        return _package_metadata()['version']
+
+    @property
+    def description(self):
+        """
+        Description of multiai
+        """
+        return _package_metadata()['description']
+
+    @property
+    def url(self):
+        """
+        URL of the homepage of multiai
+        """
+        return _package_metadata()['url']
+
     def set_provider(self, provider):
         """
         Set AI provider
@@ -111,6 +133,44 @@ class Prompt():
             print(f'AI provider "{provider}" is not available.')
             sys.exit(1)
 
+    def set_fallback(self, providers):
+        """
+        Set providers asked when self.ai_provider fails
+
+        :param providers: list or str
+            AI providers in the order to ask (case insensitive), or a
+            comma separated string of them
+        """
+        if isinstance(providers, str):
+            providers = providers.split(',')
+        fallback = []
+        for provider in providers:
+            provider = provider.strip()
+            if provider == '':
+                continue
+            try:
+                fallback.append(Provider[provider.upper()])
+            except Exception:
+                print(f'AI provider "{provider}" is not available.')
+                sys.exit(1)
+        self.fallback_providers = fallback
+
+    def add_hook(self, hook):
+        """
+        Add a function called with the metrics of each question.
+
+        The metrics is a dict with time, provider, model, seconds,
+        first_token_seconds, input_tokens, output_tokens,
+        estimated_tokens, requests, cached_requests, retries,
+        continuations, cost and error. It is also set to self.metrics.
+        When a question is asked to more than one provider, the function
+        is called for each provider, possibly from other threads.
+
+        :param hook: function
+            function which takes the metrics
+        """
+        self.hooks.append(hook)
+
     def set_model(self, provider, model):
         """
         Set model
@@ -127,17 +187,67 @@ class Prompt():
     def clear(self):
         """
         Clear chat history.
+
+        The new conversation is not saved to the session. Call
+        save_session() to save it.
+        """
+        self.conversation = Conversation()
+        self.session_id = None
+
+    def save_session(self, session_id=None):
+        """
+        Save the conversation to self.sessions, and keep saving it after
+        each message.
+
+        :param session_id: str
+            id of the session. Default is a new id.
+        :return: str
+            id of the session
+        """
+        if self.sessions is None:
+            print('Session file is not set in [session] section.')
+            sys.exit(1)
+        if session_id is None:
+            session_id = self.sessions.new_id()
+        self.conversation.save(self.sessions, session_id)
+        self.session_id = session_id
+        return session_id
+
+    def load_session(self, session_id=None):
+        """
+        Resume a conversation saved to self.sessions.
+
+        Messages are read when they are needed for the next request.
+        The following messages are saved to the same session.
+
+        :param session_id: str
+            id of the session. Default is the session updated last.
+        :return: str
+            id of the session
         """
-        self.openai_messages = []
-        self.anthropic_messages = []
-        self.google_chat = None
-        self.perplexity_messages = []
-        self.mistral_messages = []
+        if self.sessions is None:
+            print('Session file is not set in [session] section.')
+            sys.exit(1)
+        if session_id is None:
+            session_id = self.sessions.latest()
+            if session_id is None:
+                print('No session is saved.')
+                sys.exit(1)
+        elif not self.sessions.exists(session_id):
+            print(f'Session "{session_id}" is not found.')
+            sys.exit(1)
+        self.conversation = Conversation.load(self.sessions, session_id)
+        self.session_id = session_id
+        return session_id
 
     def ask(self, prompt, request=1, verbose=False):
         """
         Ask a question to AI.
 
+        When the answer is not finished because of max_tokens, the request
+        is continued until max_requests requests or max_total_tokens tokens
+        of the answer, and the parts of the answer are joined.
+
         :param prompt: str
             prompt to ask AI
         :param request: int
@@ -147,392 +257,2236 @@ class Prompt():
         :return: str
             Answer from AI
         """
-        self.message = [
-            {
-                "role": self.role,
-                "content": prompt,
-            }
-        ]
-        self.prompt = prompt
-        if request == 1:
-            self.prompt_continue = False
-        else:
-            self.prompt_continue = True
-        # For example, call ask_openai() for openai
-        func_name = 'ask_' + self.ai_provider.name.lower()
-        try:
-            func = getattr(self, func_name)
-        except AttributeError:
-            print(
-                f'multiai system error: {func_name}() function is not defined.')
-            sys.exit(1)
-        func()
-        # Error
-        if self.error:
-            return self.error_message
-        # Finish successfully
-        if self.finish_reason in ['stop', 'end_turn']:
-            return self.response
-        # Unexpected finish reason
-        if self.finish_reason not in ['length', 'max_tokens']:
-            self.response += '\n\nFinish reason: {self.finish_reason}'
-            return self.response
-        # Response not finished. Continue the request.
-        request += 1
-        if request > self.max_requests:
-            self.response += '\n\nFinished because of max_tokens and max_requests.'
-            return self.response
-        if verbose:
-            print(
-                f'{self.color("Repeating...")} max_requests = {self.max_requests}, requests = {request}\r',
-                end='')
-        response = self.response
-        answer = self.ask('continue', request=request, verbose=verbose)
-        if self.error:
-            return answer
-        return response + answer
+        if request == 1 and self._routed():
+            return self._ask_routed(prompt, verbose)
+        parts = []
+        while True:
+            self._set_message(prompt, request)
+            key = self._cache_key()
+            if not self._cache_load(key):
+                self._send(verbose)
+                self._cache_save(key)
+            if self.error:
+                self._report()
+                return self.error_message
+            request = self._next_request(request, verbose)
+            parts.append(self.response)
+            if request is None:
+                self._report()
+                return ''.join(parts)
+            prompt = 'continue'
 
-    def ask_print(self, prompt, prompt_summary=None):
+    async def ask_async(self, prompt, request=1, verbose=False):
         """
-        Ask a question to AI and print, copy, log
+        Ask a question to AI asynchronously.
+
+        It works in the same way as ask(), but the request is sent with
+        the asynchronous client of each provider, so that many clients
+        can wait for their answers in one event loop.
 
         :param prompt: str
             prompt to ask AI
-        :param prompt_summary: str
-            prompt shortened for logging
+        :param request: int
+            numbers of repetitive request
+        :param verbose: boolean
+            show repeat process
+        :return: str
+            Answer from AI
         """
-        print(f'{self.color("Please wait ......")}\r', end='')
-        if len(self.ai_providers) == 1:
-            answer = self.ask(prompt, verbose=True)
-            print(' ' * 50 + '\r', end='')
-            if self.error:
-                print(f'{self.color("Error message")}> {answer}')
-                sys.exit(1)
-            print(f'{self.color(self.model)}>')
-            if self.log:
-                if prompt_summary is not None:
-                    prompt = prompt_summary
-                try:
-                    with open(self.log_file, mode='a') as f:
-                        f.write(
-                            f'### {self.role}:\n{prompt}\n### {self.model}:\n{answer}\n')
-                except Exception as e:
-                    print(e)
-                    print('Check the setting of log_file.')
-                    sys.exit(1)
-        else:
-            answer = ''
-            if prompt_summary is None:
-                prompt_log = prompt
+        import asyncio
+        if request == 1 and self._routed():
+            return await self._ask_routed_async(prompt, verbose)
+        parts = []
+        while True:
+            if self.history_policy == 'summarize':
+                # The summary of older history is asked in a thread, not
+                # to block the other questions in the event loop.
+                await asyncio.to_thread(self._set_message, prompt, request)
             else:
-                prompt_log = prompt_summary
-            for provider in (self.ai_providers):
-                self.ai_provider = provider
-                single_answer = self.ask(prompt, verbose=True)
-                model = getattr(self, 'model_' + provider.name.lower(), None)
-                if self.error:
-                    print(
-                        f'{self.color("Error message from " + provider.name.lower())}> {single_answer}')
-                    sys.exit(1)
-                answer += f'### {model}:\n{single_answer}\n\n'
-            answer = answer.strip()
-            if self.log:
-                with open(self.log_file, mode='a') as f:
-                    f.write(
-                        f'### {self.role}:\n{prompt_log}\n{answer}\n')
-        print(' ' * 50 + '\r', end='')
-        print_long(answer)
-        if self.copy:
-            pyperclip.copy(answer)
+                self._set_message(prompt, request)
+            key = self._cache_key()
+            if not self._cache_load(key):
+                await self._send_async(verbose)
+                self._cache_save(key)
+            if self.error:
+                self._report()
+                return self.error_message
+            request = self._next_request(request, verbose)
+            parts.append(self.response)
+            if request is None:
+                self._report()
+                return ''.join(parts)
+            prompt = 'continue'
 
-    def interactive(self, pre_prompt=''):
+    def ask_stream(self, prompt, verbose=False):
         """
-        Interactive mode
+        Ask a question to AI and yield the answer as it arrives.
 
-        :param pre_prompt: str
-            pre-prompt to append before prompt
+        When the answer is not finished because of max_tokens, the request
+        is continued as in ask(), and the continued answer is also yielded.
+        The whole answer is set to self.answer after the iteration.
+        When an error occurs, the iteration stops, self.error is set to
+        True and the error message is set to self.answer.
+        With fallback providers, the next provider is asked when a provider
+        fails before the first chunk of its answer.
+
+        :param prompt: str
+            prompt to ask AI
+        :param verbose: boolean
+            show repeat process
+        :return: generator
+            text chunks of the answer
         """
-        prompt = ''
-        blank = 0
-        b = self.blank_lines
-        if len(self.ai_providers) == 0:
-            self.ai_providers = [self.ai_provider]
-        if b > 0:
-            print(
-                f'\nInput {b} blank line{"s" if b > 1 else ""} to finish input.')
+        if self._routed():
+            yield from self._ask_stream_routed(prompt, verbose)
+            return
+        parts = []
+        request = 1
         while True:
-            try:
-                if prompt == '':
-                    line = input(f'{self.color(self.role)}> ')
-                else:
-                    line = input()
-            except EOFError:
-                sys.exit()
-            except KeyboardInterrupt:
-                sys.exit()
-            if line == '':
-                if prompt == '':
-                    print('Blank text entered. Enter "q" to quit.')
-                    continue
-                blank += 1
-                if blank < self.blank_lines:
-                    prompt += line + '\n'
-                else:
-                    self.ask_print(pre_prompt + prompt.strip())
-                    prompt = ''
-                    blank = 0
-            elif prompt == '' and line in ['q', 'x', 'quit', 'exit']:
-                sys.exit()
+            self._set_message(prompt, request)
+            key = self._cache_key()
+            if self._cache_load(key):
+                yield self.response
             else:
-                if self.blank_lines == 0:
-                    self.ask_print(pre_prompt + line)
-                    prompt = ''
-                else:
-                    prompt += line + '\n'
-                    blank = 0
+                yield from self._send_stream(verbose)
+                self._cache_save(key)
+            if self.error:
+                self.answer = self.error_message
+                self._report()
+                return
+            response = self.response
+            request = self._next_request(request, verbose)
+            # Message added by _next_request()
+            if len(self.response) > len(response):
+                yield self.response[len(response):]
+            parts.append(self.response)
+            if request is None:
+                break
+            prompt = 'continue'
+        self.answer = ''.join(parts)
+        self._report()
 
-    def color(self, text):
+    def _ask_stream_routed(self, prompt, verbose=False):
         """
-        Return colored text with color defined at self.prompt_color
+        Ask a question to self.ai_provider and yield the answer as it
+        arrives, and ask the fallback providers in order when it fails
+        before the first chunk. After the first chunk, the answer cannot
+        be taken back, so an error is not retried by the next provider.
 
-        :param text: str
-            Text
-        :return: str
-            Colored text
+        :param prompt: str
+            prompt to ask AI
+        :param verbose: boolean
+            show repeat process
+        :return: generator
+            text chunks of the answer
         """
-        if sys.stdout.isatty():
-            return f'\033[{self.prompt_color}m{text}\033[0m'
-        else:
-            return text
+        self.conversation.append(self.role, prompt)
+        for provider in self._route():
+            client = self._fork(provider, shared_prompt=True)
+            started = False
+            try:
+                for chunk in client.ask_stream(prompt, verbose):
+                    if not started:
+                        started = True
+                        self.answered_by = provider
+                    yield chunk
+            except (Exception, SystemExit) as e:
+                client._fail(e)
+            if started or not client.error:
+                break
+        self._take(client)
+        self.answer = client.error_message if client.error else client.answer
 
-    def retrieve_from_url(self, url, verbose=True):
+    def _routed(self):
         """
-        Retrieve text from URL.
+        Check whether a question is routed to more than one provider by
+        self.fallback_providers.
 
-        When URL ends with ".pdf", PDF file is converted to text.
+        :return: boolean
+            True when routed
+        """
+        return any(provider != self.ai_provider
+                   for provider in self.fallback_providers)
 
-        :param url: str
-            URL to retrieve data from
-        :param verbose: boolean
-            whether to print message
-        :return: str
-            Retrieved text
+    def _route(self):
         """
-        if verbose:
-            print('Retrieving ...\r', end='')
-        headers = {
-            'User-Agent': self.user_agent if hasattr(self, 'user_agent') else None}
-        try:
-            response = requests.get(url, headers=headers)
-        except Exception as e:
-            if verbose:
-                print(e)
-            sys.exit(1)
-        if response.status_code != 200:
-            if verbose:
-                print(f'{response.status_code} - {response.reason}')
-            sys.exit(1)
-        if verbose:
-            print('Converting to text.\r', end='')
-        if url.lower().endswith('.pdf'):
-            with BytesIO(response.content) as pdf_file:
-                reader = PyPDF2.PdfReader(pdf_file)
-                text = ""
-                for page in range(len(reader.pages)):
-                    text += reader.pages[page].extract_text()
-        else:
-            text = trafilatura.extract(response.text)
-            if text is None:
-                if verbose:
-                    print(f'{url} could not be retrieved.')
-                sys.exit(1)
-        return text
+        Return the providers to ask in order.
 
-    # Implementations for each providers
-    def ask_openai(self):
+        :return: list
+            self.ai_provider followed by the fallback providers
         """
-        Ask a question to OpenAI.
+        providers = [self.ai_provider]
+        for provider in self.fallback_providers:
+            if provider not in providers:
+                providers.append(provider)
+        return providers
+
+    def _hedge_after(self, provider):
         """
-        if self.openai_api_key is None:
-            self.error = True
-            self.error_message = 'API key for OpenAI is not set.'
-            return
-        openai.api_key = self.openai_api_key
-        if not self.prompt_continue:
-            self.openai_messages += self.message
-        try:
-            self.completion = openai.chat.completions.create(
-                messages=self.openai_messages,
-                model=self.model_openai,
-                temperature=self.temperature,
-                max_tokens=self.max_tokens
-            )
-            self.error = False
-            self.response = self.completion.choices[0].message.content.strip(
-            )
-            self.finish_reason = self.completion.choices[0].finish_reason
-            self.openai_messages += [{"role": "assistant",
-                                      "content": self.response}]
-        except openai.APIError as e:
-            self.error = True
-            try:
-                self.error_code = e.status_code
-                self.error_dict = e.body
-                self.error_type = f"Error {self.error_code}: {self.error_dict['code']}"
-                self.error_message = f"{self.error_type}\n{self.error_dict['message']}"
-            except Exception:
-                self.error_message = e
+        Return the time to wait for a provider before asking the next one.
 
-    def ask_anthropic(self):
+        :param provider: Provider
+            AI provider asked last
+        :return: float or None
+            seconds, or None not to hedge
         """
-        Ask a question to Anthropic.
+        if not self.hedge:
+            return None
+        delay = latency_percentile(provider.name.lower(), self.hedge_percentile)
+        if delay is None:
+            delay = self.hedge_delay
+        return delay
+
+    def _ask_routed(self, prompt, verbose=False):
         """
-        if self.anthropic_api_key is None:
-            self.error = True
-            self.error_message = 'API key for Anthropic is not set.'
-            return
-        client = anthropic.Anthropic(api_key=self.anthropic_api_key)
-        self.anthropic_messages += self.message
-        try:
-            self.completion = client.messages.create(
-                messages=self.anthropic_messages,
-                model=self.model_anthropic,
-                temperature=self.temperature,
-                max_tokens=self.max_tokens if self.max_tokens else self.max_tokens_anthropic
-            )
-            self.error = False
-            self.response = self.completion.content[0].text.strip()
-            self.finish_reason = self.completion.stop_reason
-            self.anthropic_messages += [{"role": "assistant",
-                                         "content": self.response}]
-        except Exception as e:
-            self.error = True
-            try:
-                self.error_code = e.status_code
-                self.error_dict = e.body['error']
-                self.error_type = f"{self.error_code}: {self.error_dict['type']}"
-                self.error_message = f"{self.error_type}\n{self.error_dict['message']}"
-            except Exception:
-                self.error_message = e
+        Ask a question to self.ai_provider, and to the fallback providers
+        in order when it fails.
 
-    def ask_google(self):
+        When self.hedge is True, the next provider is also asked when the
+        answer does not arrive within the hedge_percentile of the latency
+        of the provider. The first answer is taken. The other requests,
+        which cannot be interrupted in their threads, run to the end, but
+        their answers are discarded and they send no further requests.
+
+        :param prompt: str
+            prompt to ask AI
+        :param verbose: boolean
+            show repeat process
+        :return: str
+            Answer from AI
         """
-        Ask a question to Google.
+        providers = self._route()
+        self.conversation.append(self.role, prompt)
+        results = queue.Queue()
+        clients = []
+
+        def run(client):
+            try:
+                answer = client.ask(prompt, verbose=verbose)
+            except (Exception, SystemExit) as e:
+                answer = client._fail(e)
+            results.put((client, answer))
+
+        def start(provider):
+            client = self._fork(provider, shared_prompt=True)
+            clients.append(client)
+            # Daemon thread does not keep the process after a cancel.
+            threading.Thread(target=run, args=(client,), daemon=True).start()
+            delay = self._hedge_after(provider)
+            return None if delay is None else time.monotonic() + delay
+
+        hedge_at = start(providers[0])
+        running = 1
+        while running:
+            timeout = None
+            if hedge_at is not None and len(clients) < len(providers):
+                timeout = max(hedge_at - time.monotonic(), 0)
+            try:
+                client, answer = results.get(timeout=timeout)
+            except queue.Empty:
+                hedge_at = start(providers[len(clients)])
+                running += 1
+                continue
+            running -= 1
+            if not client.error:
+                break
+            if running == 0 and len(clients) < len(providers):
+                hedge_at = start(providers[len(clients)])
+                running += 1
+        for other in clients:
+            if other is not client:
+                other._cancelled = True
+        self._take(client)
+        return answer
+
+    async def _ask_routed_async(self, prompt, verbose=False):
         """
-        # Supress logging warnings of libraries
-        os.environ["GRPC_VERBOSITY"] = "ERROR"
-        os.environ["GLOG_minloglevel"] = "2"
-        if self.google_api_key is None:
+        Ask a question asynchronously in the same way as _ask_routed().
+        The other requests are cancelled at once.
+
+        :param prompt: str
+            prompt to ask AI
+        :param verbose: boolean
+            show repeat process
+        :return: str
+            Answer from AI
+        """
+        import asyncio
+        providers = self._route()
+        self.conversation.append(self.role, prompt)
+        tasks = {}
+        started = []
+
+        async def run(client):
+            try:
+                return await client.ask_async(prompt, verbose=verbose)
+            except (Exception, SystemExit) as e:
+                return client._fail(e)
+
+        def start(provider):
+            client = self._fork(provider, shared_prompt=True)
+            started.append(client)
+            task = asyncio.ensure_future(run(client))
+            tasks[task] = client
+            delay = self._hedge_after(provider)
+            return None if delay is None else time.monotonic() + delay
+
+        hedge_at = start(providers[0])
+        result = None
+        try:
+            while tasks:
+                timeout = None
+                if hedge_at is not None and len(started) < len(providers):
+                    timeout = max(hedge_at - time.monotonic(), 0)
+                done, _ = await asyncio.wait(
+                    tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedge_at = start(providers[len(started)])
+                    continue
+                for task in done:
+                    result = (tasks.pop(task), task.result())
+                    if not result[0].error:
+                        break
+                if not result[0].error:
+                    break
+                if not tasks and len(started) < len(providers):
+                    hedge_at = start(providers[len(started)])
+        finally:
+            # Requests still running are cancelled also when this is.
+            for task, other in tasks.items():
+                other._cancelled = True
+                task.cancel()
+        client, answer = result
+        self._take(client)
+        return answer
+
+    def _fail(self, exception):
+        """
+        Set the error of a question stopped by an exception, such as an
+        error of the SDK or a missing SDK, so that the next provider is
+        asked.
+
+        :param exception: BaseException
+            exception raised by the backend
+        :return: str
+            error message
+        """
+        if isinstance(exception, SystemExit):
+            # The reason is already printed.
+            message = f'{self.ai_provider.name.lower()} stopped with status {exception.code}.'
+        else:
+            message = f'{type(exception).__name__}: {exception}'
+        self.set_error(message)
+        return message
+
+    def _take(self, client):
+        """
+        Take the state of the request from a client made by _fork().
+
+        :param client: Prompt
+            copied client
+        """
+        for name in ['response', 'finish_reason', 'error', 'error_message',
+                     'completion', 'prompt', 'messages', 'metrics']:
+            if hasattr(client, name):
+                setattr(self, name, getattr(client, name))
+        self.answered_by = client.ai_provider
+
+    def _set_message(self, prompt, request):
+        """
+        Add the prompt to the conversation and set self.messages to the
+        messages to be sent in the next request.
+
+        :param prompt: str
+            prompt to ask AI
+        :param request: int
+            numbers of repetitive request
+        """
+        self.prompt = prompt
+        self.request = request
+        if request == 1:
+            self.prompt_continue = False
+            self.answered_by = self.ai_provider
+            self.answer_tokens = 0
+            self._started = time.perf_counter()
+            self._first_token = None
+            self._counts = dict(
+                requests=0, cached_requests=0, retries=0,
+                input_tokens=0, output_tokens=0, estimated_tokens=False)
+            if self._shared_prompt:
+                self._shared_prompt = False
+            else:
+                self.conversation.append(self.role, prompt)
+        else:
+            self.prompt_continue = True
+            # OpenAI and Anthropic continue the last answer of assistant
+            # (prefill) without 'continue'.
+            if self.ai_provider not in [Provider.OPENAI, Provider.ANTHROPIC]:
+                self.conversation.append(
+                    self.role, prompt, self.ai_provider.name.lower())
+        self.messages = self._history_messages()
+
+    def _send(self, verbose=False):
+        """
+        Send the request to self.ai_provider within its rate limit, and
+        retry it when it fails with an error which may be temporary.
+
+        :param verbose: boolean
+            show retry process
+        """
+        # For example, ask_openai() for openai
+        func = self._provider_function('ask')
+        attempt = 0
+        while True:
+            if not self._before_send():
+                return
+            self._limiter().wait(self._request_tokens())
+            start = time.perf_counter()
+            func()
+            if not self.error:
+                record_latency(self.ai_provider.name.lower(),
+                               time.perf_counter() - start)
+                self._count_request()
+            delay = self._retry_delay(attempt, verbose)
+            if delay is None:
+                return
+            time.sleep(delay)
+            attempt += 1
+            self._counts['retries'] += 1
+
+    async def _send_async(self, verbose=False):
+        """
+        Send the request to self.ai_provider asynchronously in the same
+        way as _send().
+
+        :param verbose: boolean
+            show retry process
+        """
+        import asyncio
+        # For example, ask_openai_async() for openai
+        func = self._provider_function('ask_async')
+        attempt = 0
+        while True:
+            if not self._before_send():
+                return
+            await self._limiter().wait_async(self._request_tokens())
+            start = time.perf_counter()
+            await func()
+            if not self.error:
+                record_latency(self.ai_provider.name.lower(),
+                               time.perf_counter() - start)
+                self._count_request()
+            delay = self._retry_delay(attempt, verbose)
+            if delay is None:
+                return
+            await asyncio.sleep(delay)
+            attempt += 1
+            self._counts['retries'] += 1
+
+    def _send_stream(self, verbose=False):
+        """
+        Send the request to self.ai_provider in the same way as _send(),
+        and yield the answer as it arrives.
+
+        The request is not retried after a part of the answer is yielded.
+
+        :param verbose: boolean
+            show retry process
+        :return: generator
+            text chunks of the answer
+        """
+        # For example, stream_openai() for openai
+        func = self._provider_function('stream')
+        attempt = 0
+        while True:
+            if not self._before_send():
+                return
+            self._limiter().wait(self._request_tokens())
+            started = False
+            for chunk in func():
+                if self._first_token is None:
+                    self._first_token = time.perf_counter() - self._started
+                started = True
+                yield chunk
+            if not self.error:
+                self._count_request()
+            if started:
+                return
+            delay = self._retry_delay(attempt, verbose)
+            if delay is None:
+                return
+            time.sleep(delay)
+            attempt += 1
+            self._counts['retries'] += 1
+
+    def _before_send(self):
+        """
+        Reset the error status set by the error handler of each provider.
+
+        :return: boolean
+            False when the request is cancelled by hedging
+        """
+        self.error_retryable = False
+        self.error_retry_after = None
+        self.usage = None
+        if self._cancelled:
+            self.error = True
+            self.error_message = 'Cancelled because another provider answered.'
+            return False
+        return True
+
+    def _count_request(self):
+        """
+        Add the tokens of a successful request to the metrics of the question.
+
+        Tokens are estimated when the provider does not give them.
+        """
+        usage = self.usage
+        if usage is None:
+            usage = (history_tokens(self.messages),
+                     estimate_tokens(self.response))
+            self._counts['estimated_tokens'] = True
+        self._counts['requests'] += 1
+        self._counts['input_tokens'] += usage[0]
+        self._counts['output_tokens'] += usage[1]
+
+    def _report(self):
+        """
+        Make the metrics of the question, and give it to the hooks and
+        the metrics file.
+        """
+        name = self.ai_provider.name.lower()
+        model = getattr(self, 'model_' + name, None)
+        counts = self._counts
+        cost = None
+        price = self.prices.get(model)
+        if price is not None and len(price) == 2:
+            cost = (counts['input_tokens'] * price[0] + counts['output_tokens'] * price[1]) / 1000000
+        self.metrics = dict(
+            time=time.strftime('%Y-%m-%dT%H:%M:%S'),
+            provider=name,
+            model=model,
+            seconds=round(time.perf_counter() - self._started, 3),
+            first_token_seconds=None if self._first_token is None else round(
+                self._first_token, 3),
+            continuations=max(counts['requests'] - 1, 0),
+            cost=cost,
+            error=self.error,
+            **counts)
+        for hook in list(self.hooks):
+            hook(self.metrics)
+        if self.metrics_file:
+            try:
+                write_metrics(self.metrics_file, self.metrics)
+            except OSError as e:
+                print(e)
+                print('Check the setting of file in [metrics] section.')
+                sys.exit(1)
+
+    def _limiter(self):
+        """
+        Return the rate limiter of self.ai_provider.
+
+        :return: RateLimiter
+            rate limiter shared in the process
+        """
+        return get_limiter(self.ai_provider.name.lower(),
+                           *self.rate_limits[self.ai_provider])
+
+    def _request_tokens(self):
+        """
+        Estimate the number of tokens of the next request.
+
+        :return: int
+            tokens of the messages and max_tokens
+        """
+        return history_tokens(self.messages) + (self._max_tokens() or 0)
+
+    def _max_tokens(self, default=None):
+        """
+        Return max_tokens of the next request, which is limited by the
+        tokens left in max_total_tokens.
+
+        :param default: int
+            value used when max_tokens is not set
+        :return: int or None
+            max_tokens, or None not to send it
+        """
+        max_tokens = self.max_tokens or default
+        if self.max_total_tokens is None:
+            return max_tokens
+        left = max(self.max_total_tokens - self.answer_tokens, 1)
+        if max_tokens is None or max_tokens > left:
+            return left
+        return max_tokens
+
+    def _strip(self, text):
+        """
+        Strip text of a response.
+
+        Leading spaces of a continued answer are kept, as they may
+        separate it from the previous part.
+
+        :param text: str
+            text of a response
+        :return: str
+            stripped text
+        """
+        if self.prompt_continue:
+            return text.rstrip()
+        return text.strip()
+
+    def _retry_delay(self, attempt, verbose=False):
+        """
+        Decide whether to retry the request after an error.
+
+        The delay is given by Retry-After header of the response, or
+        otherwise chosen at random up to the exponential backoff, so that
+        clients retrying at once are spread.
+
+        :param attempt: int
+            number of retries done
+        :param verbose: boolean
+            show retry process
+        :return: float or None
+            seconds to wait before retrying, or None not to retry
+        """
+        if not self.error or not self.error_retryable:
+            return None
+        if attempt >= self.max_retries:
+            return None
+        if self.error_retry_after is not None:
+            if self.error_retry_after > self.max_backoff:
+                return None
+            delay = self.error_retry_after
+        else:
+            delay = random.uniform(
+                0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        if verbose:
+            print(
+                f'{self.color("Retrying...")} max_retries = {self.max_retries}, retries = {attempt + 1}\r',
+                end='')
+        return delay
+
+    def _provider_function(self, method):
+        """
+        Return the function implementing the request to self.ai_provider.
+
+        :param method: str
+            'ask', 'ask_async' or 'stream' of the backend
+        :return: function
+            function without arguments. For example, it calls
+            self.ask_openai() for 'ask' of openai.
+        """
+        return functools.partial(
+            getattr(_backend(self.ai_provider), method), self)
+
+    def request_params(self):
+        """
+        Return the arguments of the request to self.ai_provider, which
+        are used by the backend of a provider.
+
+        :return: dict
+            messages (list of dict with "role" and "content"), model,
+            temperature and max_tokens (None when not limited)
+        """
+        return dict(
+            messages=self.messages,
+            model=getattr(self, 'model_' + self.ai_provider.name.lower()),
+            temperature=self.temperature,
+            max_tokens=self._max_tokens()
+        )
+
+    def set_response(self, text, finish_reason, usage=None):
+        """
+        Set the answer of a request, which is called by the backend of a
+        provider.
+
+        :param text: str
+            answer
+        :param finish_reason: str
+            reason why the answer finished. 'length' or 'max_tokens' lets
+            the answer continue in the next request, and 'stop' or
+            'end_turn' finishes the answer.
+        :param usage: tuple
+            (input tokens, output tokens), or None to estimate them
+        """
+        self.completion = None
+        self.usage = usage
+        self.error = False
+        self.response = self._strip(text)
+        self.finish_reason = finish_reason
+        self._add_response()
+
+    def set_error(self, message, retryable=False, retry_after=None):
+        """
+        Set the error of a request, which is called by the backend of a
+        provider.
+
+        :param message: str
+            error message
+        :param retryable: boolean
+            whether the request may succeed when retried, such as for
+            HTTP status 429 and 503
+        :param retry_after: float
+            seconds to wait before retrying, or None
+        """
+        self.error = True
+        self.error_message = message
+        self.error_retryable = retryable
+        self.error_retry_after = retry_after
+
+    def _cache_key(self):
+        """
+        Return the key of the response cache for the next request.
+
+        :return: str or None
+            key, or None when the response is not to be cached
+        """
+        if self.cache is None or self.temperature > self.cache_max_temperature:
+            return None
+        name = self.ai_provider.name.lower()
+        return self.cache.key(
+            provider=name,
+            model=getattr(self, 'model_' + name),
+            temperature=self.temperature,
+            max_tokens=self._max_tokens(),
+            messages=self.messages)
+
+    def _cache_load(self, key):
+        """
+        Load the response from the response cache.
+
+        When it is found, it is added to the conversation as if it was
+        answered by the provider.
+
+        :param key: str or None
+            key returned by _cache_key()
+        :return: boolean
+            whether the response was found
+        """
+        if key is None:
+            return False
+        cached = self.cache.get(key)
+        if cached is None:
+            return False
+        self.completion = None
+        self.error = False
+        self.response, self.finish_reason = cached
+        self._counts['requests'] += 1
+        self._counts['cached_requests'] += 1
+        self._add_response()
+        return True
+
+    def _cache_save(self, key):
+        """
+        Save the response to the response cache.
+
+        :param key: str or None
+            key returned by _cache_key()
+        """
+        if key is None or self.error:
+            return
+        self.cache.put(key, self.response, self.finish_reason)
+
+    def _history_messages(self):
+        """
+        Return the messages of the conversation to send to self.ai_provider
+        within the limit of self.history_policy.
+
+        When older messages are summarized, they are replaced with the
+        summary in the conversation, so that they are not summarized again.
+
+        :return: list
+            messages with "role" and "content"
+        """
+        messages, indexes = self.conversation.translate(
+            self.ai_provider.name.lower())
+        if self.history_policy == 'none':
+            return messages
+        summaries = []
+
+        def summarize(older):
+            summary = self._summarize_history(older)
+            summaries.append(summary)
+            return summary
+
+        compacted = compact_history(
+            messages, self.history_policy,
+            max_turns=self.history_max_turns,
+            max_tokens=self.history_max_tokens,
+            summarize=summarize)
+        if summaries and summaries[0] is not None:
+            # compacted is the summary (2 messages) and recent messages
+            index = indexes[len(messages) - len(compacted) + 2]
+            if index >= 0:
+                self.conversation.summarize(index, summaries[0])
+        return compacted
+
+    def _add_response(self):
+        """
+        Add self.response to the conversation as the answer of self.ai_provider.
+        """
+        if self._cancelled:
+            return
+        self.conversation.append(
+            'assistant', self.response, self.ai_provider.name.lower())
+
+    def _summarize_history(self, messages):
+        """
+        Summarize older messages of chat history.
+
+        :param messages: list
+            messages to summarize
+        :return: str or None
+            summary, or None when an error occurs
+        """
+        client = self._fork(self.ai_provider)
+        client.clear()
+        client.history_policy = 'none'
+        # The summary is not a question of the user to report.
+        client.hooks = []
+        client.metrics_file = None
+        conversation = '\n\n'.join(
+            f'{message["role"]}: {message["content"]}' for message in messages)
+        summary = client.ask(self.history_prompt + '\n\n' + conversation)
+        if client.error:
+            return None
+        return summary
+
+    def _next_request(self, request, verbose):
+        """
+        Check finish reason of the response and decide whether to continue.
+
+        :param request: int
+            numbers of repetitive request
+        :param verbose: boolean
+            show repeat process
+        :return: int or None
+            number of the next request, or None when the response is finished
+        """
+        # Finish successfully
+        if self.finish_reason in ['stop', 'end_turn']:
+            return None
+        # Unexpected finish reason
+        if self.finish_reason not in ['length', 'max_tokens']:
+            self.response += f'\n\nFinish reason: {self.finish_reason}'
+            return None
+        # Response not finished. Continue the request.
+        self.answer_tokens += estimate_tokens(self.response)
+        if self.max_total_tokens is not None and self.answer_tokens >= self.max_total_tokens:
+            self.response += '\n\nFinished because of max_total_tokens.'
+            return None
+        request += 1
+        if request > self.max_requests:
+            self.response += '\n\nFinished because of max_tokens and max_requests.'
+            return None
+        if verbose:
+            print(
+                f'{self.color("Repeating...")} max_requests = {self.max_requests}, requests = {request}\r',
+                end='')
+        return request
+
+    def ask_print(self, prompt, prompt_summary=None):
+        """
+        Ask a question to AI and print, copy, log
+
+        When self.stats is True, metrics of the question are also printed.
+
+        :param prompt: str
+            prompt to ask AI
+        :param prompt_summary: str
+            prompt shortened for logging
+        """
+        if not self.stats:
+            self._ask_print(prompt, prompt_summary)
+            return
+        records = []
+        self.hooks.append(records.append)
+        try:
+            self._ask_print(prompt, prompt_summary)
+        finally:
+            self.hooks.remove(records.append)
+        for record in records:
+            print(f'{self.color("Stats")}> {format_metrics(record)}')
+
+    def _ask_print(self, prompt, prompt_summary=None):
+        """
+        Ask a question to AI and print, copy, log
+
+        :param prompt: str
+            prompt to ask AI
+        :param prompt_summary: str
+            prompt shortened for logging
+        """
+        if self.stream:
+            self._ask_print_stream(prompt, prompt_summary)
+            return
+        print(f'{self.color("Please wait ......")}\r', end='')
+        if len(self.ai_providers) == 1:
+            answer = self.ask(prompt, verbose=True)
+            print(' ' * 50 + '\r', end='')
+            if self.error:
+                print(f'{self.color("Error message")}> {answer}')
+                sys.exit(1)
+            model = self.model
+            if self.answered_by != self.ai_provider:
+                # Answered by a fallback provider
+                model = getattr(self, 'model_' + self.answered_by.name.lower())
+            print(f'{self.color(model)}>')
+            if self.log:
+                if prompt_summary is not None:
+                    prompt = prompt_summary
+                try:
+                    with open(self.log_file, mode='a') as f:
+                        f.write(
+                            f'### {self.role}:\n{prompt}\n### {model}:\n{answer}\n')
+                except Exception as e:
+                    print(e)
+                    print('Check the setting of log_file.')
+                    sys.exit(1)
+        else:
+            answer = ''
+            if prompt_summary is None:
+                prompt_log = prompt
+            else:
+                prompt_log = prompt_summary
+            results = self.ask_providers(prompt)
+            print(' ' * 50 + '\r', end='')
+            errors = [(provider, single_answer) for provider, single_answer,
+                      error, elapsed in results if error]
+            for provider, single_answer in errors:
+                print(
+                    f'{self.color("Error message from " + provider.name.lower())}> {single_answer}')
+            if errors:
+                sys.exit(1)
+            times = []
+            for provider, single_answer, error, elapsed in results:
+                model = getattr(self, 'model_' + provider.name.lower(), None)
+                answer += f'### {model}:\n{single_answer}\n\n'
+                times.append(f'{model} {elapsed:.2f} s')
+            print(f'{self.color("Time")}> {", ".join(times)}')
+            answer = answer.strip()
+            if self.log:
+                with open(self.log_file, mode='a') as f:
+                    f.write(
+                        f'### {self.role}:\n{prompt_log}\n{answer}\n')
+        print(' ' * 50 + '\r', end='')
+        print_long(answer)
+        if self.copy:
+            import pyperclip
+            pyperclip.copy(answer)
+
+    def ask_providers(self, prompt):
+        """
+        Ask a question to every provider in self.ai_providers.
+
+        When self.parallel is True, all providers are asked at once in
+        separate threads, so that the total time is that of the slowest
+        provider. Otherwise they are asked one after another.
+
+        :param prompt: str
+            prompt to ask AI
+        :return: list
+            (provider, answer, error, elapsed) for each provider in the
+            order of self.ai_providers, where elapsed is the wall time
+            in seconds
+        """
+        providers = list(self.ai_providers)
+        # The prompt is added once, and then answered by each provider.
+        self.conversation.append(self.role, prompt)
+        if self.parallel and len(providers) > 1:
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=len(providers)) as executor:
+                futures = [executor.submit(self._ask_provider, provider, prompt)
+                           for provider in providers]
+                runs = [future.result() for future in futures]
+        else:
+            runs = [self._ask_provider(provider, prompt)
+                    for provider in providers]
+        results = []
+        for provider, (client, answer, elapsed) in zip(providers, runs):
+            results.append((provider, answer, client.error, elapsed))
+        return results
+
+    def _ask_print_stream(self, prompt, prompt_summary=None):
+        """
+        Ask a question to AI and print the answer as it arrives, copy, log
+
+        When more than one provider is selected, they are asked one
+        after another.
+
+        :param prompt: str
+            prompt to ask AI
+        :param prompt_summary: str
+            prompt shortened for logging
+        """
+        answers = []
+        if len(self.ai_providers) == 1:
+            # Asked by this client to fail over to the fallback providers.
+            clients = [self]
+        else:
+            self.conversation.append(self.role, prompt)
+            clients = [self._fork(provider, shared_prompt=True)
+                       for provider in self.ai_providers]
+        for client in clients:
+            model = None
+            for chunk in client.ask_stream(prompt):
+                if model is None:
+                    # The header shows the model which answers.
+                    model = getattr(
+                        client, 'model_' + client.answered_by.name.lower())
+                    print(f'{self.color(model)}>')
+                print(chunk, end='', flush=True)
+            if model is None:
+                model = client.model
+                print(f'{self.color(model)}>')
+            print()
+            if client.error:
+                print(f'{self.color("Error message")}> {client.error_message}')
+                sys.exit(1)
+            answers.append(f'### {model}:\n{client.answer}')
+        answer = '\n\n'.join(answers)
+        if self.log:
+            if prompt_summary is not None:
+                prompt = prompt_summary
+            try:
+                with open(self.log_file, mode='a') as f:
+                    f.write(f'### {self.role}:\n{prompt}\n{answer}\n')
+            except Exception as e:
+                print(e)
+                print('Check the setting of log_file.')
+                sys.exit(1)
+        if self.copy:
+            if len(self.ai_providers) == 1:
+                answer = client.answer
+            import pyperclip
+            pyperclip.copy(answer)
+
+    def _ask_provider(self, provider, prompt):
+        """
+        Ask a question to a provider with a copy of this client.
+
+        :param provider: Provider
+            AI provider
+        :param prompt: str
+            prompt to ask AI
+        :return: tuple
+            (copied client, answer, elapsed time in seconds)
+        """
+        client = self._fork(provider, shared_prompt=True)
+        start = time.perf_counter()
+        answer = client.ask(prompt)
+        return client, answer, time.perf_counter() - start
+
+    def _fork(self, provider, shared_prompt=False):
+        """
+        Return a shallow copy of this client to ask a provider.
+
+        The copy shares the conversation with this client, while the
+        state of each request (response, error, etc.) is kept in the copy,
+        so that it can run in parallel with other providers.
+
+        :param provider: Provider
+            AI provider
+        :param shared_prompt: boolean
+            whether the prompt of the next request is already added to
+            the conversation
+        :return: Prompt
+            copied client
+        """
+        client = copy.copy(self)
+        client.ai_provider = provider
+        client.model = getattr(self, 'model_' + provider.name.lower(), None)
+        client._shared_prompt = shared_prompt
+        client._cancelled = False
+        # The copy asks only the provider.
+        client.fallback_providers = []
+        return client
+
+    def interactive(self, pre_prompt=''):
+        """
+        Interactive mode
+
+        :param pre_prompt: str
+            pre-prompt to append before prompt
+        """
+        prompt = ''
+        blank = 0
+        b = self.blank_lines
+        if len(self.ai_providers) == 0:
+            self.ai_providers = [self.ai_provider]
+        if b > 0:
+            print(
+                f'\nInput {b} blank line{"s" if b > 1 else ""} to finish input.')
+        while True:
+            try:
+                if prompt == '':
+                    line = input(f'{self.color(self.role)}> ')
+                else:
+                    line = input()
+            except EOFError:
+                sys.exit()
+            except KeyboardInterrupt:
+                sys.exit()
+            if line == '':
+                if prompt == '':
+                    print('Blank text entered. Enter "q" to quit.')
+                    continue
+                blank += 1
+                if blank < self.blank_lines:
+                    prompt += line + '\n'
+                else:
+                    self.ask_print(pre_prompt + prompt.strip())
+                    prompt = ''
+                    blank = 0
+            elif prompt == '' and line in ['q', 'x', 'quit', 'exit']:
+                sys.exit()
+            else:
+                if self.blank_lines == 0:
+                    self.ask_print(pre_prompt + line)
+                    prompt = ''
+                else:
+                    prompt += line + '\n'
+                    blank = 0
+
+    def color(self, text):
+        """
+        Return colored text with color defined at self.prompt_color
+
+        :param text: str
+            Text
+        :return: str
+            Colored text
+        """
+        if sys.stdout.isatty():
+            return f'\033[{self.prompt_color}m{text}\033[0m'
+        else:
+            return text
+
+    def retrieve_from_url(self, url, verbose=True, pages=None, max_chars=None):
+        """
+        Retrieve text from URL.
+
+        When URL ends with ".pdf", PDF file is converted to text.
+        PDF file is downloaded to a temporary file in chunks, and its
+        pages are converted in parallel.
+        When self.page_cache is set, the text is cached, and it is used
+        when the server answers that the page is not modified.
+
+        :param url: str
+            URL to retrieve data from
+        :param verbose: boolean
+            whether to print message
+        :param pages: tuple
+            (first, last) page numbers of PDF file to convert, starting
+            from 1. None for all pages, and last can be None for the last page.
+        :param max_chars: int
+            maximum number of characters of the text, or None for no limit
+        :return: str
+            Retrieved text
+        """
+        import requests
+        if verbose:
+            print('Retrieving ...\r', end='')
+        headers = {
+            'User-Agent': self.user_agent if hasattr(self, 'user_agent') else None}
+        # Conditional request with the validators of the cached text
+        key = json.dumps([url, pages, max_chars])
+        cached = None
+        if self.page_cache is not None:
+            cached = self.page_cache.get(key)
+            if cached is not None:
+                if cached[1]:
+                    headers['If-None-Match'] = cached[1]
+                if cached[2]:
+                    headers['If-Modified-Since'] = cached[2]
+        session = self._client('requests', requests.Session)
+        try:
+            response = session.get(
+                url, headers=headers, stream=True, timeout=self.timeout)
+        except Exception as e:
+            if verbose:
+                print(e)
+            sys.exit(1)
+        if response.status_code == 304 and cached is not None:
+            response.close()
+            return cached[0]
+        if response.status_code != 200:
+            if verbose:
+                print(f'{response.status_code} - {response.reason}')
+            sys.exit(1)
+        if url.lower().endswith('.pdf'):
+            import tempfile
+            from .pdf import extract_pdf
+            # The file is closed before it is read by worker processes.
+            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as f:
+                pdf_file = f.name
+                try:
+                    for chunk in response.iter_content(chunk_size=1 << 16):
+                        f.write(chunk)
+                except Exception as e:
+                    if verbose:
+                        print(e)
+                    os.remove(pdf_file)
+                    sys.exit(1)
+            if verbose:
+                print('Converting to text.\r', end='')
+            try:
+                text = extract_pdf(pdf_file, pages=pages, max_chars=max_chars)
+            finally:
+                os.remove(pdf_file)
+        else:
+            import trafilatura
+            if verbose:
+                print('Converting to text.\r', end='')
+            text = trafilatura.extract(response.text)
+            if text is None:
+                if verbose:
+                    print(f'{url} could not be retrieved.')
+                sys.exit(1)
+            if max_chars is not None:
+                text = text[:max_chars]
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if self.page_cache is not None and (etag or last_modified):
+            self.page_cache.put(key, text, etag, last_modified)
+        return text
+
+    def close(self):
+        """
+        Close the clients of providers kept for reuse.
+
+        Clients for asynchronous requests are closed by aclose().
+        """
+        for name, client in self._pop_clients(include_async=False):
+            if hasattr(client, '__exit__'):
+                client.__exit__(None, None, None)
+
+    async def aclose(self):
+        """
+        Close the clients of providers kept for reuse, including
+        clients for asynchronous requests.
+        """
+        for name, client in self._pop_clients(include_async=True):
+            if name.endswith('_async'):
+                if hasattr(client, '__aexit__'):
+                    await client.__aexit__(None, None, None)
+            elif hasattr(client, '__exit__'):
+                client.__exit__(None, None, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _client(self, name, factory, **kwargs):
+        """
+        Return a client of a provider, creating it at the first call.
+
+        Clients are cached with the name and the arguments as a key,
+        so that connections are reused in the following requests.
+        Asynchronous clients are cached for each event loop, which owns
+        their connections.
+
+        :param name: str
+            name of the client, ending with '_async' for asynchronous one
+        :param factory: class
+            class of the client
+        :param kwargs: dict
+            arguments to create the client, such as api_key and base_url
+        :return: object
+            client
+        """
+        key = (name,) + tuple(sorted(kwargs.items()))
+        loop = None
+        if name.endswith('_async'):
+            import asyncio
+            loop = asyncio.get_running_loop()
+            key += (loop,)
+        with self._clients_lock:
+            client = self._clients.get(key)
+            if client is None:
+                if loop is not None:
+                    # Clients of closed loops cannot be used any more.
+                    for old in [old for old in self._clients
+                                if old[0].endswith('_async') and old[-1].is_closed()]:
+                        del self._clients[old]
+                client = factory(**kwargs)
+                self._clients[key] = client
+        return client
+
+    def _pop_clients(self, include_async):
+        """
+        Remove the cached clients.
+
+        :param include_async: boolean
+            whether to remove clients for asynchronous requests
+        :return: list
+            (name, client) of the removed clients
+        """
+        with self._clients_lock:
+            keys = [key for key in self._clients
+                    if include_async or not key[0].endswith('_async')]
+            clients = [(key[0], self._clients.pop(key)) for key in keys]
+        return clients
+
+    # Implementations for each providers
+    #
+    # ask_provider() and ask_provider_async() share the preparation of
+    # the request and the handling of the response and the error.
+    def ask_openai(self):
+        """
+        Ask a question to OpenAI.
+        """
+        import openai
+        request = self._openai_request()
+        if request is None:
+            return
+        client = self._client(
+            'openai', openai.OpenAI, api_key=self.openai_api_key,
+            max_retries=0)
+        try:
+            self._chat_response(client.chat.completions.create(**request))
+        except openai.APIError as e:
+            self._openai_error(e)
+
+    async def ask_openai_async(self):
+        """
+        Ask a question to OpenAI asynchronously.
+        """
+        import openai
+        request = self._openai_request()
+        if request is None:
+            return
+        client = self._client(
+            'openai_async', openai.AsyncOpenAI, api_key=self.openai_api_key,
+            max_retries=0)
+        try:
+            self._chat_response(await client.chat.completions.create(**request))
+        except openai.APIError as e:
+            self._openai_error(e)
+
+    def stream_openai(self):
+        """
+        Ask a question to OpenAI and yield the answer as it arrives.
+        """
+        import openai
+        request = self._openai_request()
+        if request is None:
+            return
+        client = self._client(
+            'openai', openai.OpenAI, api_key=self.openai_api_key,
+            max_retries=0)
+        try:
+            yield from self._chat_stream(
+                client.chat.completions.create(stream=True, **request))
+        except openai.APIError as e:
+            self._openai_error(e)
+
+    def _openai_request(self):
+        """
+        Prepare a request to OpenAI.
+
+        :return: dict or None
+            arguments of the request, or None when API key is not set
+        """
+        if self.openai_api_key is None:
             self.error = True
-            self.error_message = 'API key for Google is not set.'
+            self.error_message = 'API key for OpenAI is not set.'
+            return None
+        return dict(
+            messages=self.messages,
+            model=self.model_openai,
+            temperature=self.temperature,
+            max_tokens=self._max_tokens()
+        )
+
+    def _openai_error(self, e):
+        """
+        Set error message from OpenAI.
+
+        :param e: openai.APIError
+            raised error
+        """
+        self.error = True
+        self.error_retryable, self.error_retry_after = error_status(e)
+        try:
+            self.error_code = e.status_code
+            self.error_dict = e.body
+            self.error_type = f"Error {self.error_code}: {self.error_dict['code']}"
+            self.error_message = f"{self.error_type}\n{self.error_dict['message']}"
+        except Exception:
+            self.error_message = e
+
+    def _chat_response(self, completion):
+        """
+        Read a response in the chat completion format.
+
+        It is shared by OpenAI, Perplexity and Mistral.
+
+        :param completion: object
+            chat completion returned by the provider
+        """
+        self.completion = completion
+        self.usage = completion_usage(completion)
+        self.error = False
+        self.response = self._strip(
+            self.completion.choices[0].message.content)
+        self.finish_reason = self.completion.choices[0].finish_reason
+        self._add_response()
+
+    def _chat_stream(self, stream):
+        """
+        Read a streamed response in the chat completion format.
+
+        It is shared by OpenAI, Perplexity and Mistral.
+
+        :param stream: iterable
+            chunks of chat completion returned by the provider
+        :return: generator
+            text chunks of the answer
+        """
+        parts = []
+        finish_reason = None
+        usage = None
+        for chunk in stream:
+            # Usage is given in the last chunk, if any
+            usage = completion_usage(chunk) or usage
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            if choice.delta.content:
+                parts.append(choice.delta.content)
+                yield choice.delta.content
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
+        self.completion = None
+        self.usage = usage
+        self.error = False
+        self.response = self._strip(''.join(parts))
+        self.finish_reason = finish_reason
+        self._add_response()
+
+    def ask_anthropic(self):
+        """
+        Ask a question to Anthropic.
+        """
+        import anthropic
+        request = self._anthropic_request()
+        if request is None:
+            return
+        client = self._client(
+            'anthropic', anthropic.Anthropic, api_key=self.anthropic_api_key,
+            max_retries=0)
+        try:
+            self._anthropic_response(client.messages.create(**request))
+        except Exception as e:
+            self._anthropic_error(e)
+
+    async def ask_anthropic_async(self):
+        """
+        Ask a question to Anthropic asynchronously.
+        """
+        import anthropic
+        request = self._anthropic_request()
+        if request is None:
+            return
+        client = self._client(
+            'anthropic_async', anthropic.AsyncAnthropic,
+            api_key=self.anthropic_api_key, max_retries=0)
+        try:
+            self._anthropic_response(await client.messages.create(**request))
+        except Exception as e:
+            self._anthropic_error(e)
+
+    def stream_anthropic(self):
+        """
+        Ask a question to Anthropic and yield the answer as it arrives.
+        """
+        import anthropic
+        request = self._anthropic_request()
+        if request is None:
             return
-        genai.configure(api_key=self.google_api_key)
-        model = genai.GenerativeModel(self.model_google)
-        if self.google_chat is None:
-            self.google_chat = model.start_chat(history=[])
-        config = genai.types.GenerationConfig(
+        client = self._client(
+            'anthropic', anthropic.Anthropic, api_key=self.anthropic_api_key,
+            max_retries=0)
+        try:
+            with client.messages.stream(**request) as stream:
+                yield from stream.text_stream
+                completion = stream.get_final_message()
+            self._anthropic_response(completion)
+        except Exception as e:
+            self._anthropic_error(e)
+
+    def _anthropic_request(self):
+        """
+        Prepare a request to Anthropic.
+
+        :return: dict or None
+            arguments of the request, or None when API key is not set
+        """
+        if self.anthropic_api_key is None:
+            self.error = True
+            self.error_message = 'API key for Anthropic is not set.'
+            return None
+        return dict(
+            messages=self.messages,
+            model=self.model_anthropic,
             temperature=self.temperature,
-            max_output_tokens=self.max_tokens)
+            max_tokens=self._max_tokens(self.max_tokens_anthropic)
+        )
+
+    def _anthropic_response(self, completion):
+        """
+        Read a response from Anthropic.
+
+        :param completion: anthropic.types.Message
+            message returned by Anthropic
+        """
+        self.completion = completion
+        self.usage = completion_usage(completion)
+        self.error = False
+        self.response = self._strip(self.completion.content[0].text)
+        self.finish_reason = self.completion.stop_reason
+        self._add_response()
+
+    def _anthropic_error(self, e):
+        """
+        Set error message from Anthropic.
+
+        :param e: Exception
+            raised error
+        """
+        self.error = True
+        self.error_retryable, self.error_retry_after = error_status(e)
+        try:
+            self.error_code = e.status_code
+            self.error_dict = e.body['error']
+            self.error_type = f"{self.error_code}: {self.error_dict['type']}"
+            self.error_message = f"{self.error_type}\n{self.error_dict['message']}"
+        except Exception:
+            self.error_message = e
+
+    def ask_google(self):
+        """
+        Ask a question to Google.
+        """
+        request = self._google_request()
+        if request is None:
+            return
+        model, request = request
+        try:
+            self._google_response(model.generate_content(**request))
+        except Exception as e:
+            self._google_error(e)
+
+    async def ask_google_async(self):
+        """
+        Ask a question to Google asynchronously.
+        """
+        request = self._google_request()
+        if request is None:
+            return
+        model, request = request
+        try:
+            self._google_response(
+                await model.generate_content_async(**request))
+        except Exception as e:
+            self._google_error(e)
+
+    def stream_google(self):
+        """
+        Ask a question to Google and yield the answer as it arrives.
+        """
+        request = self._google_request()
+        if request is None:
+            return
+        model, request = request
         try:
-            self.completion = self.google_chat.send_message(
-                self.prompt, generation_config=config)
-            self.error = False
-            self.response = self.completion.text.replace('•', '* ').strip()
-            self.finish_reason = self.completion.candidates[0].finish_reason.name.lower(
-            )
+            completion = model.generate_content(stream=True, **request)
+            for chunk in completion:
+                yield chunk.text.replace('•', '* ')
+            self._google_response(completion)
         except Exception as e:
+            self._google_error(e)
+
+    def _google_request(self):
+        """
+        Prepare a request to Google.
+
+        :return: tuple or None
+            (model, arguments of the request), or None when API key is
+            not set
+        """
+        global _google_api_key
+        import google.generativeai as genai
+        # Supress logging warnings of libraries
+        os.environ["GRPC_VERBOSITY"] = "ERROR"
+        os.environ["GLOG_minloglevel"] = "2"
+        if self.google_api_key is None:
             self.error = True
-            try:
-                self.error_message = e.message
-            except Exception:
-                self.error_message = e
+            self.error_message = 'API key for Google is not set.'
+            return None
+        # genai.configure() replaces the global client of genai, so it is
+        # called only when the API key is changed.
+        with _google_lock:
+            if _google_api_key != self.google_api_key:
+                genai.configure(api_key=self.google_api_key)
+                _google_api_key = self.google_api_key
+        model = self._client(
+            'google', genai.GenerativeModel, model_name=self.model_google)
+        contents = [{"role": "model" if message["role"] == 'assistant' else "user",
+                     "parts": [message["content"]]}
+                    for message in self.messages]
+        return model, dict(
+            contents=contents,
+            generation_config=genai.types.GenerationConfig(
+                temperature=self.temperature,
+                max_output_tokens=self._max_tokens()))
+
+    def _google_response(self, completion):
+        """
+        Read a response from Google.
+
+        :param completion: genai.types.GenerateContentResponse
+            response returned by Google
+        """
+        self.completion = completion
+        self.usage = completion_usage(completion)
+        self.error = False
+        self.response = self._strip(self.completion.text.replace('•', '* '))
+        self.finish_reason = self.completion.candidates[0].finish_reason.name.lower(
+        )
+        self._add_response()
+
+    def _google_error(self, e):
+        """
+        Set error message from Google.
+
+        :param e: Exception
+            raised error
+        """
+        self.error = True
+        self.error_retryable, self.error_retry_after = error_status(e)
+        try:
+            self.error_message = e.message
+        except Exception:
+            self.error_message = e
 
     def ask_perplexity(self):
         """
         Ask a question to perplexity.
         """
-        if self.perplexity_api_key is None:
-            self.error = True
-            self.error_message = 'API key for Perplexity is not set.'
+        import openai
+        request = self._perplexity_request()
+        if request is None:
             return
-        base_url = 'https://api.perplexity.ai'
-        client = openai.OpenAI(
+        client = self._client(
+            'perplexity', openai.OpenAI,
             api_key=self.perplexity_api_key,
-            base_url=base_url)
-        self.perplexity_messages += self.message
+            base_url=self.perplexity_base_url, max_retries=0)
         try:
-            self.completion = client.chat.completions.create(
-                messages=self.perplexity_messages,
-                model=self.model_perplexity,
-                temperature=self.temperature,
-                max_tokens=self.max_tokens
-            )
-            self.error = False
-            self.response = self.completion.choices[0].message.content.strip(
-            )
-            self.finish_reason = self.completion.choices[0].finish_reason
-            self.perplexity_messages += [{"role": "assistant",
-                                          "content": self.response}]
+            self._chat_response(client.chat.completions.create(**request))
+        except openai.APIError as e:
+            self._perplexity_error(e)
+
+    async def ask_perplexity_async(self):
+        """
+        Ask a question to perplexity asynchronously.
+        """
+        import openai
+        request = self._perplexity_request()
+        if request is None:
+            return
+        client = self._client(
+            'perplexity_async', openai.AsyncOpenAI,
+            api_key=self.perplexity_api_key,
+            base_url=self.perplexity_base_url, max_retries=0)
+        try:
+            self._chat_response(await client.chat.completions.create(**request))
+        except openai.APIError as e:
+            self._perplexity_error(e)
+
+    def stream_perplexity(self):
+        """
+        Ask a question to perplexity and yield the answer as it arrives.
+        """
+        import openai
+        request = self._perplexity_request()
+        if request is None:
+            return
+        client = self._client(
+            'perplexity', openai.OpenAI,
+            api_key=self.perplexity_api_key,
+            base_url=self.perplexity_base_url, max_retries=0)
+        try:
+            yield from self._chat_stream(
+                client.chat.completions.create(stream=True, **request))
         except openai.APIError as e:
+            self._perplexity_error(e)
+
+    def _perplexity_request(self):
+        """
+        Prepare a request to perplexity.
+
+        :return: dict or None
+            arguments of the request, or None when API key is not set
+        """
+        if self.perplexity_api_key is None:
             self.error = True
-            try:
-                # print(f'e = {e.__dict__.keys()}')
-                # for key in e.__dict__.keys():
-                #     print(f'e.{key} = {getattr(e, key)}')
-                message = trafilatura.extract(e.message)
-                self.error_message = message.splitlines()[0]
-            except Exception:
-                self.error_message = e
+            self.error_message = 'API key for Perplexity is not set.'
+            return None
+        return dict(
+            messages=self.messages,
+            model=self.model_perplexity,
+            temperature=self.temperature,
+            max_tokens=self._max_tokens()
+        )
+
+    def _perplexity_error(self, e):
+        """
+        Set error message from perplexity.
+
+        :param e: openai.APIError
+            raised error
+        """
+        self.error = True
+        self.error_retryable, self.error_retry_after = error_status(e)
+        try:
+            # print(f'e = {e.__dict__.keys()}')
+            # for key in e.__dict__.keys():
+            #     print(f'e.{key} = {getattr(e, key)}')
+            import trafilatura
+            message = trafilatura.extract(e.message)
+            self.error_message = message.splitlines()[0]
+        except Exception:
+            self.error_message = e
 
     def ask_mistral(self):
         """
         Ask a question to mistral.
         """
+        import mistralai
+        request = self._mistral_request()
+        if request is None:
+            return
+        client = self._client(
+            'mistral', mistralai.Mistral, api_key=self.mistral_api_key)
+        try:
+            self._chat_response(client.chat.complete(**request))
+        except mistralai.SDKError as e:
+            self._mistral_error(e)
+
+    async def ask_mistral_async(self):
+        """
+        Ask a question to mistral asynchronously.
+        """
+        import mistralai
+        request = self._mistral_request()
+        if request is None:
+            return
+        client = self._client(
+            'mistral_async', mistralai.Mistral, api_key=self.mistral_api_key)
+        try:
+            self._chat_response(await client.chat.complete_async(**request))
+        except mistralai.SDKError as e:
+            self._mistral_error(e)
+
+    def stream_mistral(self):
+        """
+        Ask a question to mistral and yield the answer as it arrives.
+        """
+        import mistralai
+        request = self._mistral_request()
+        if request is None:
+            return
+        client = self._client(
+            'mistral', mistralai.Mistral, api_key=self.mistral_api_key)
+        try:
+            yield from self._chat_stream(
+                event.data for event in client.chat.stream(**request))
+        except mistralai.SDKError as e:
+            self._mistral_error(e)
+
+    def _mistral_request(self):
+        """
+        Prepare a request to mistral.
+
+        :return: dict or None
+            arguments of the request, or None when API key is not set
+        """
         if self.mistral_api_key is None:
             self.error = True
             self.error_message = 'API key for Mistral is not set.'
+            return None
+        return dict(
+            messages=self.messages,
+            model=self.model_mistral,
+            temperature=self.temperature,
+            max_tokens=self._max_tokens()
+        )
+
+    def _mistral_error(self, e):
+        """
+        Set error message from mistral.
+
+        :param e: mistralai.SDKError
+            raised error
+        """
+        self.error = True
+        self.error_retryable, self.error_retry_after = error_status(e)
+        try:
+            self.error_code = e.status_code
+            self.error_dict = json.loads(e.body)
+            self.error_message = f"Error {self.error_code}: {self.error_dict['message']}"
+        except Exception:
+            self.error_message = e
+
+    def ask_local(self):
+        """
+        Ask a question to an OpenAI-compatible endpoint.
+        """
+        import openai
+        endpoint, request = self._local_request()
+        if request is None:
             return
-        client = mistralai.Mistral(api_key=self.mistral_api_key)
-        self.mistral_messages += self.message
+        url = acquire_replica(self.model_local, endpoint['base_urls'],
+                              self.replica_cooldown)
+        client = self._client(
+            'local', openai.OpenAI, api_key=self._local_api_key(endpoint),
+            base_url=url, max_retries=0)
         try:
-            self.completion = client.chat.complete(
-                messages=self.mistral_messages,
-                model=self.model_mistral,
-                temperature=self.temperature,
-                max_tokens=self.max_tokens
-            )
-            self.error = False
-            self.response = self.completion.choices[0].message.content.strip(
-            )
-            self.finish_reason = self.completion.choices[0].finish_reason
-            self.mistral_messages += [{"role": "assistant",
-                                       "content": self.response}]
-        except mistralai.SDKError as e:
+            self._chat_response(client.chat.completions.create(**request))
+        except openai.APIError as e:
+            self._openai_error(e)
+        finally:
+            release_replica(self.model_local, url,
+                            self.error and self.error_retryable)
+
+    async def ask_local_async(self):
+        """
+        Ask a question to an OpenAI-compatible endpoint asynchronously.
+        """
+        import openai
+        endpoint, request = self._local_request()
+        if request is None:
+            return
+        url = acquire_replica(self.model_local, endpoint['base_urls'],
+                              self.replica_cooldown)
+        client = self._client(
+            'local_async', openai.AsyncOpenAI,
+            api_key=self._local_api_key(endpoint), base_url=url,
+            max_retries=0)
+        try:
+            self._chat_response(await client.chat.completions.create(**request))
+        except openai.APIError as e:
+            self._openai_error(e)
+        finally:
+            release_replica(self.model_local, url,
+                            self.error and self.error_retryable)
+
+    def stream_local(self):
+        """
+        Ask a question to an OpenAI-compatible endpoint and yield the
+        answer as it arrives.
+        """
+        import openai
+        endpoint, request = self._local_request()
+        if request is None:
+            return
+        url = acquire_replica(self.model_local, endpoint['base_urls'],
+                              self.replica_cooldown)
+        client = self._client(
+            'local', openai.OpenAI, api_key=self._local_api_key(endpoint),
+            base_url=url, max_retries=0)
+        try:
+            yield from self._chat_stream(
+                client.chat.completions.create(stream=True, **request))
+        except openai.APIError as e:
+            self._openai_error(e)
+        finally:
+            release_replica(self.model_local, url,
+                            self.error and self.error_retryable)
+
+    def _local_request(self):
+        """
+        Prepare a request to the endpoint named by self.model_local.
+
+        :return: tuple
+            (endpoint, arguments of the request), where the arguments
+            are None when the endpoint is not defined
+        """
+        endpoint = self.local_endpoints.get(self.model_local)
+        if endpoint is None:
             self.error = True
+            self.error_message = f'Endpoint {self.model_local} is not defined. Add [local.{self.model_local}] section to the settings file.'
+            return None, None
+        return endpoint, dict(
+            messages=self.messages,
+            model=endpoint['model'],
+            temperature=self.temperature,
+            max_tokens=self._max_tokens()
+        )
+
+    def _local_api_key(self, endpoint):
+        """
+        Return API key of an endpoint.
+
+        Local servers usually need no API key, but the SDK requires one.
+
+        :param endpoint: dict
+            endpoint in self.local_endpoints
+        :return: str
+            api_key of the endpoint, LOCAL_API_KEY or a dummy key
+        """
+        return endpoint['api_key'] or self.local_api_key or 'local'
+
+    def ask_mock(self):
+        """
+        Ask a question to the mock provider.
+        """
+        from .mock import MockError
+        request = self._mock_request()
+        try:
+            self._mock_response(self._mock_model().complete(**request))
+        except MockError as e:
+            self._mock_error(e)
+
+    async def ask_mock_async(self):
+        """
+        Ask a question to the mock provider asynchronously.
+        """
+        from .mock import MockError
+        request = self._mock_request()
+        try:
+            self._mock_response(
+                await self._mock_model().complete_async(**request))
+        except MockError as e:
+            self._mock_error(e)
+
+    def stream_mock(self):
+        """
+        Ask a question to the mock provider and yield the answer as it
+        arrives.
+        """
+        from .mock import MockError
+        request = self._mock_request()
+        try:
+            completion = yield from self._mock_model().stream(**request)
+        except MockError as e:
+            self._mock_error(e)
+            return
+        self._mock_response(completion)
+
+    def _mock_model(self):
+        """
+        Return the mock model with the settings in [mock] section.
+
+        :return: MockModel
+            model
+        """
+        from .mock import MockModel
+        return self._client(
+            'mock', MockModel,
+            latency=self.mock_latency,
+            tokens_per_second=self.mock_tokens_per_second,
+            answer_tokens=self.mock_answer_tokens,
+            finish_reasons=tuple(self.mock_finish_reasons),
+            error_rate=self.mock_error_rate,
+            error_status=self.mock_error_status)
+
+    def _mock_request(self):
+        """
+        Prepare a request to the mock provider, which needs no API key.
+
+        :return: dict
+            arguments of the request
+        """
+        return dict(
+            messages=self.messages,
+            request=self.request,
+            max_tokens=self._max_tokens()
+        )
+
+    def _mock_response(self, completion):
+        """
+        Read a response from the mock provider.
+
+        :param completion: MockCompletion
+            answer of the mock model
+        """
+        self.completion = completion
+        self.usage = completion_usage(completion)
+        self.error = False
+        self.response = self._strip(completion.text)
+        self.finish_reason = completion.finish_reason
+        self._add_response()
+
+    def _mock_error(self, e):
+        """
+        Set error message from the mock provider.
+
+        :param e: MockError
+            raised error
+        """
+        self.error = True
+        self.error_retryable, self.error_retry_after = error_status(e)
+        self.error_code = e.status_code
+        self.error_message = e.message
+
+
+def _typed_settings(settings):
+    """
+    Convert the settings to the values of the attributes of Prompt.
+
+    It is called by Settings.typed() once for each settings, so that
+    Prompt objects are made without parsing the values again.
+
+    :param settings: Settings
+        settings
+    :return: dict
+        value of each attribute
+    """
+    values = {}
+    # ai_provider can be followed by fallback providers
+    providers = settings.get('model', 'ai_provider').split(',')
+    values['ai_provider'] = _provider(providers[0].strip())
+    values['fallback_providers'] = [_provider(provider.strip())
+                                    for provider in providers[1:]
+                                    if provider.strip()]
+    for provider in Provider:
+        name = provider.name.lower()
+        model = settings.get('model', name, fallback=None)
+        if model is None:
+            if name in BUILTIN_PROVIDERS:
+                print(f'multiai system error: {name} not found in [model].')
+                sys.exit(1)
+            # Provider of other package, whose backend chooses the model
+            model = name
+        values['model_' + name] = model
+    values['temperature'] = settings.getfloat('default', 'temperature')
+    values['max_requests'] = settings.getint('default', 'max_requests')
+    values['blank_lines'] = settings.getint('command', 'blank_lines')
+    values['parallel'] = settings.getboolean('command', 'parallel')
+    values['page_cache'] = None
+    if settings.get('command', 'http_cache'):
+        values['page_cache'] = PageCache(
+            settings.get('command', 'http_cache'),
+            ttl=settings.getfloat('command', 'http_cache_ttl_days') * 86400,
+            max_entries=settings.getint('command', 'http_cache_max_entries'))
+    values['timeout'] = settings.getfloat('command', 'timeout')
+    values['always_copy'] = settings.getboolean('command', 'always_copy')
+    values['always_log'] = settings.getboolean('command', 'always_copy')
+    prompt_color = settings.get('prompt', 'color')
+    try:
+        values['prompt_color'] = ColorCode[prompt_color.upper()].value
+    except Exception:
+        print(f'Error in the settings file: color = {prompt_color}')
+        available_colors = [name.lower()
+                            for name in ColorCode.__members__.keys()]
+        print(f'Available colors: {", ".join(available_colors)}')
+        sys.exit(1)
+    # [history] section
+    values['history_policy'] = settings.get('history', 'policy')
+    if values['history_policy'] not in POLICIES:
+        print(f'Error in the settings file: policy = {values["history_policy"]}')
+        print(f'Available policies: {", ".join(POLICIES)}')
+        sys.exit(1)
+    values['history_max_turns'] = settings.getint('history', 'max_turns')
+    values['history_max_tokens'] = settings.getint('history', 'max_tokens')
+    values['history_prompt'] = settings.get('history', 'summary_prompt')
+    # [cache] section
+    values['cache'] = None
+    values['cache_max_temperature'] = settings.getfloat(
+        'cache', 'max_temperature')
+    if settings.getboolean('cache', 'enabled'):
+        values['cache'] = ResponseCache(
+            settings.get('cache', 'file'),
+            ttl=settings.getfloat('cache', 'ttl_days') * 86400,
+            max_entries=settings.getint('cache', 'max_entries'))
+    # [routing] section
+    values['hedge'] = settings.getboolean('routing', 'hedge')
+    values['hedge_percentile'] = settings.getfloat('routing', 'hedge_percentile')
+    values['hedge_delay'] = settings.getfloat('routing', 'hedge_delay')
+    values['replica_cooldown'] = settings.getfloat('routing', 'replica_cooldown')
+    # [retry] section
+    values['max_retries'] = settings.getint('retry', 'max_retries')
+    values['backoff'] = settings.getfloat('retry', 'backoff')
+    values['max_backoff'] = settings.getfloat('retry', 'max_backoff')
+    # [rate_limit] section, where the limits can be set for each provider
+    keys = ['requests_per_minute', 'tokens_per_minute']
+    defaults = [settings.getint('rate_limit', key) for key in keys]
+    values['rate_limits'] = {}
+    for provider in Provider:
+        name = provider.name.lower()
+        values['rate_limits'][provider] = tuple(
+            settings.getint('rate_limit', f'{name}_{key}', fallback=default)
+            for key, default in zip(keys, defaults))
+    # [metrics] section
+    values['metrics_file'] = settings.get('metrics', 'file') or None
+    # [price] section: model = input, output (USD per million tokens)
+    values['prices'] = {}
+    if settings.has_section('price'):
+        for model, price in settings.items('price'):
             try:
-                self.error_code = e.status_code
-                self.error_dict = json.loads(e.body)
-                self.error_message = f"Error {self.error_code}: {self.error_dict['message']}"
-            except Exception:
-                self.error_message = e
+                values['prices'][model] = tuple(
+                    float(value) for value in price.split(','))[:2]
+            except ValueError:
+                print(f'Error in the settings file: {model} = {price}')
+                sys.exit(1)
+    # [local.NAME] sections: OpenAI-compatible endpoints, which are
+    # selected by the model of local provider
+    values['local_endpoints'] = {}
+    for section in settings.sections():
+        if not section.startswith('local.'):
+            continue
+        base_urls = [url.strip() for url in
+                     settings.get(section, 'base_url', fallback='').split(',')
+                     if url.strip()]
+        model = settings.get(section, 'model', fallback=None)
+        if not base_urls or not model:
+            print(f'Error in the settings file: base_url and model are required in [{section}].')
+            sys.exit(1)
+        values['local_endpoints'][section[len('local.'):]] = dict(
+            base_urls=base_urls, model=model,
+            api_key=settings.get(section, 'api_key', fallback=None))
+    # [mock] section
+    values['mock_latency'] = settings.getfloat('mock', 'latency')
+    values['mock_tokens_per_second'] = settings.getfloat(
+        'mock', 'tokens_per_second')
+    values['mock_answer_tokens'] = settings.getint('mock', 'answer_tokens')
+    values['mock_finish_reasons'] = [
+        reason.strip()
+        for reason in settings.get('mock', 'finish_reasons').split(',')
+        if reason.strip()]
+    values['mock_error_rate'] = settings.getfloat('mock', 'error_rate')
+    values['mock_error_status'] = settings.getint('mock', 'error_status')
+    # [session] section
+    values['sessions'] = None
+    if settings.get('session', 'file'):
+        values['sessions'] = SessionStore(settings.get('session', 'file'))
+    values['autosave'] = settings.getboolean('session', 'autosave')
+    # No system default value is given from here.
+    # Default values are given by fallback values.
+    values['max_tokens'] = settings.getint(
+        'default', 'max_tokens', fallback=None)
+    # Maximum tokens of an answer including continued requests
+    values['max_total_tokens'] = settings.getint(
+        'default', 'max_total_tokens', fallback=None)
+    for provider in Provider:
+        name = provider.name.lower()
+        values[name + '_api_key'] = settings.get('api_key', name, fallback=None)
+    return values
 
 
-class Provider(enum.Enum):
+def _provider(name):
     """
+    Return the provider of a name given in the settings.
+
+    :param name: str
+        AI provider (case insensitive)
+    :return: Provider
+        provider
+    """
+    try:
+        return Provider[name.upper()]
+    except KeyError:
+        print(f'AI provider "{name}" is not available.')
+        sys.exit(1)
+
+
+@functools.cache
+def _package_metadata():
+    """
+    Read the metadata of the installed package at the first call.
+
+    :return: dict
+        version, description and url of multiai
+    """
+    metadata = importlib.metadata.metadata('multiai')
+    url = None
+    for project_url in metadata.get_all('Project-URL') or []:
+        label, value = project_url.split(',', 1)
+        if label.strip() == 'Homepage':
+            url = value.strip()
+    return {
+        'version': metadata['Version'],
+        'description': metadata['Summary'],
+        'url': url,
+    }
+
+
+if typing.TYPE_CHECKING:
+    # Type checkers cannot see the members made at run time, so that the
+    # built-in providers are given statically. Keep it in BUILTIN_PROVIDERS.
+    class Provider(enum.Enum):
+        ANTHROPIC = 1
+        GOOGLE = 2
+        OPENAI = 3
+        PERPLEXITY = 4
+        MISTRAL = 5
+        LOCAL = 6
+        MOCK = 7
+else:
+    # Members are the providers in the registry, such as Provider.OPENAI.
+    Provider = enum.Enum(
+        'Provider', [name.upper() for name in provider_names()],
+        module=__name__)
+Provider.__doc__ = """
     Provider is an Enum representing AI provider available at multiai.
 
-    To add a provider definition,
-    (1) Add the provider here. Note that the first letter should not
-        overwrap other command-line options
-    (2) Define ask_provider() function in Prompt class
-    (3) Update clear() function in Prompt class
-    (4) Define default model at system.ini
+    To add a built-in provider,
+    (1) Add the provider to BUILTIN_PROVIDERS in registry.py, and to
+        the static Provider above for type checkers. Note that the first
+        letter should not overwrap other command-line options, otherwise
+        only the long option is given
+    (2) Define ask_provider(), ask_provider_async() and stream_provider()
+        functions in Prompt class
+    (3) Define default model at system.ini
+
+    Other packages can add a provider without changing multiai by an
+    entry point of a Backend. See registry.py.
+    """
+
+
+class _PromptBackend(Backend):
+    """
+    Backend of a built-in provider, whose requests are implemented by
+    ask_provider(), ask_provider_async() and stream_provider() of Prompt.
+    """
+
+    def __init__(self, name):
+        """
+        :param name: str
+            name of the provider
+        """
+        for method, func_name in [('ask', f'ask_{name}'),
+                                  ('ask_async', f'ask_{name}_async'),
+                                  ('stream', f'stream_{name}')]:
+            try:
+                setattr(self, method, getattr(Prompt, func_name))
+            except AttributeError:
+                print(
+                    f'multiai system error: {func_name}() function is not defined.')
+                sys.exit(1)
+
+
+@functools.cache
+def _backend(provider):
+    """
+    Return the backend of a provider, which is resolved at the first call.
+
+    :param provider: Provider
+        AI provider
+    :return: Backend
+        backend
     """
-    ANTHROPIC = enum.auto()
-    GOOGLE = enum.auto()
-    OPENAI = enum.auto()
-    PERPLEXITY = enum.auto()
-    MISTRAL = enum.auto()
+    name = provider.name.lower()
+    if name in BUILTIN_PROVIDERS:
+        return _PromptBackend(name)
+    return load_backend(name)
 
 
 class ColorCode(enum.Enum):
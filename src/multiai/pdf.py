@@ -0,0 +1,91 @@
+"""
+pdf - extract text from PDF files
+"""
+import concurrent.futures
+import os
+
+__all__ = [
+    "extract_pdf",
+]
+
+# Number of pages extracted by a worker process at once
+PAGES_PER_TASK = 16
+# PDF files with fewer pages are extracted in this process, because
+# starting worker processes takes longer than extracting them.
+MIN_PAGES_FOR_PROCESSES = 64
+
+
+def extract_pdf(file, pages=None, max_chars=None, processes=None):
+    """
+    Extract text from a PDF file.
+
+    Pages of a large PDF file are extracted in parallel by worker
+    processes, and the extraction stops when max_chars is reached.
+
+    :param file: str
+        path of the PDF file
+    :param pages: tuple
+        (first, last) page numbers to extract, starting from 1.
+        None for all pages, and last can be None for the last page.
+    :param max_chars: int
+        stop extracting when the text reaches this number of characters,
+        or None for no limit
+    :param processes: int
+        maximum number of worker processes. Default is the number of CPUs.
+    :return: str
+        extracted text
+    """
+    import PyPDF2
+    reader = PyPDF2.PdfReader(file)
+    first, last = 1, len(reader.pages)
+    if pages is not None:
+        first = max(pages[0], 1)
+        if pages[1] is not None:
+            last = min(pages[1], last)
+    # Page indexes of tasks, each of which has PAGES_PER_TASK pages
+    tasks = [(start, min(start + PAGES_PER_TASK, last))
+             for start in range(first - 1, last, PAGES_PER_TASK)]
+    parts = []
+    chars = 0
+    if last - first + 1 < MIN_PAGES_FOR_PROCESSES or processes == 1:
+        for start, end in tasks:
+            for index in range(start, end):
+                text = reader.pages[index].extract_text()
+                parts.append(text)
+                chars += len(text)
+                if max_chars is not None and chars >= max_chars:
+                    return ''.join(parts)[:max_chars]
+        return ''.join(parts)
+    if processes is None:
+        processes = os.cpu_count()
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=processes) as executor:
+        futures = [executor.submit(_extract_pages, file, start, end)
+                   for start, end in tasks]
+        for future in futures:
+            text = future.result()
+            parts.append(text)
+            chars += len(text)
+            if max_chars is not None and chars >= max_chars:
+                executor.shutdown(cancel_futures=True)
+                return ''.join(parts)[:max_chars]
+    return ''.join(parts)
+
+
+def _extract_pages(file, start, end):
+    """
+    Extract text from pages of a PDF file in a worker process.
+
+    :param file: str
+        path of the PDF file
+    :param start: int
+        index of the first page
+    :param end: int
+        index after the last page
+    :return: str
+        extracted text
+    """
+    import PyPDF2
+    reader = PyPDF2.PdfReader(file)
+    return ''.join(reader.pages[index].extract_text()
+                   for index in range(start, end))
@@ -1,9 +1,25 @@
 """
 print_long - print long text with pypager
 """
+import bisect
+import itertools
 import shutil
+import sys
 import unicodedata
-import pypager
+
+
+class _WidthTable(dict):
+    """
+    Display width of characters, looked up at the first use of each character.
+    """
+
+    def __missing__(self, char):
+        width = 2 if unicodedata.east_asian_width(char) in 'WF' else 1
+        self[char] = width
+        return width
+
+
+_widths = _WidthTable()
 
 
 def print_long(text):
@@ -16,23 +32,57 @@ def print_long(text):
     :param text: str
         text to display
     """
+    # The thin client of multiai server shows it in its terminal.
+    page = getattr(sys.stdout, 'page', None)
+    if page is not None:
+        page(text)
+        return
     default_terminal_size = (80, 20)
     terminal_size = shutil.get_terminal_size(default_terminal_size)
     lines_per_page = terminal_size.lines - 1
     terminal_width = terminal_size.columns
-    wrapped_lines = []
-    for line in text.split('\n'):
-        wrapped_lines.extend(wrap_text(line, terminal_width))
-    total_lines = len(wrapped_lines)
-    wrapped_text = '\n'.join(wrapped_lines)
-    if total_lines <= lines_per_page:
+    lines = text.split('\n')
+    if fits_in_page(lines, terminal_width, lines_per_page):
         print(text)
     else:
+        import pypager
+        wrapped_lines = []
+        for line in lines:
+            wrapped_lines.extend(wrap_text(line, terminal_width))
+        wrapped_text = '\n'.join(wrapped_lines)
         p = pypager.pager.Pager()
         p.add_source(pypager.source.StringSource(wrapped_text))
         p.run()
 
 
+def fits_in_page(lines, width, height):
+    """
+    Check whether lines fit in a page after wrapping.
+
+    It stops counting as soon as the page height is exceeded.
+
+    :param lines: list
+        lines of text
+    :param width: int
+        display width
+    :param height: int
+        number of lines in a page
+    :return: boolean
+        True when lines fit in a page
+    """
+    if len(lines) > height:
+        return False
+    total = 0
+    for line in lines:
+        if line.isascii():
+            total += max(1, -(-len(line) // width))
+        else:
+            total += len(wrap_text(line, width))
+        if total > height:
+            return False
+    return True
+
+
 def calculate_display_width(text):
     """
     Calculate display width of a line.
@@ -40,13 +90,9 @@ def calculate_display_width(text):
     :param text: str
         text to count
     """
-    width = 0
-    for char in text:
-        if unicodedata.east_asian_width(char) in 'WF':
-            width += 2
-        else:
-            width += 1
-    return width
+    if text.isascii():
+        return len(text)
+    return sum(map(_widths.__getitem__, text))
 
 
 def wrap_text(text, width):
@@ -59,25 +105,28 @@ def wrap_text(text, width):
         display width
     """
     lines = []
-    current_line = ""
-    current_width = 0
     for line in text.split('\n'):
         if not line:
             lines.append("")
             continue
-        for char in line:
-            char_width = 2 if unicodedata.east_asian_width(char) in 'WF' else 1
-            if current_width + char_width > width:
-                lines.append(current_line)
-                current_line = char
-                current_width = char_width
-            else:
-                current_line += char
-                current_width += char_width
-        if current_line:
-            lines.append(current_line)
-            current_line = ""
-            current_width = 0
-    if current_line:
-        lines.append(current_line)
+        if line.isascii():
+            lines.extend(line[i:i + width]
+                         for i in range(0, len(line), width))
+            continue
+        # offsets[i] is the display width of line[:i]
+        offsets = list(itertools.accumulate(
+            map(_widths.__getitem__, line), initial=0))
+        start = 0
+        while start < len(line) and offsets[-1] - offsets[start] > width:
+            end = bisect.bisect_right(
+                offsets, offsets[start] + width, start) - 1
+            if end == start:
+                # A character wider than the display width
+                if start == 0:
+                    lines.append("")
+                end = start + 1
+            lines.append(line[start:end])
+            start = end
+        if start < len(line):
+            lines.append(line[start:])
     return lines
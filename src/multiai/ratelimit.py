@@ -0,0 +1,203 @@
+"""
+ratelimit - rate limits and retries of requests to AI providers
+"""
+import threading
+import time
+
+__all__ = [
+    "RateLimiter",
+    "error_status",
+    "get_limiter",
+]
+
+# HTTP status codes of errors which may succeed when retried
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+# Errors of SDKs raised when the connection fails, which have no status code
+RETRY_ERRORS = {'APIConnectionError', 'APITimeoutError',
+                'ConnectError', 'ReadTimeout', 'ServiceUnavailable'}
+
+_limiters: dict[tuple, 'RateLimiter'] = {}
+_limiters_lock = threading.Lock()
+
+
+class _Bucket():
+    """
+    Token bucket which is refilled at a constant rate.
+
+    The level can be negative, which means that the tokens are reserved
+    by callers waiting for them. A caller waits until the level it
+    reserved is refilled, so that callers are served in the order of
+    arrival at the rate of the bucket.
+    """
+
+    def __init__(self, per_minute):
+        """
+        :param per_minute: int
+            tokens refilled in a minute, which is also the capacity
+        """
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def reserve(self, amount, now):
+        """
+        Take tokens from the bucket.
+
+        :param amount: int
+            number of tokens, which is limited to the capacity
+        :param now: float
+            current time of time.monotonic()
+        :return: float
+            seconds to wait until the tokens are available
+        """
+        self.level = min(self.capacity,
+                         self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        self.level -= min(amount, self.capacity)
+        if self.level >= 0:
+            return 0
+        return -self.level / self.rate
+
+
+class RateLimiter():
+    """
+    Rate limiter of requests and tokens per minute, shared by threads.
+
+    Usage:
+        limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=10000)
+        limiter.wait(tokens)
+    """
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0):
+        """
+        :param requests_per_minute: int
+            maximum number of requests per minute, or 0 for no limit
+        :param tokens_per_minute: int
+            maximum number of tokens per minute, or 0 for no limit
+        """
+        self._buckets = []
+        if requests_per_minute > 0:
+            self._buckets.append((_Bucket(requests_per_minute), False))
+        if tokens_per_minute > 0:
+            self._buckets.append((_Bucket(tokens_per_minute), True))
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=0):
+        """
+        Reserve a request.
+
+        :param tokens: int
+            estimated number of tokens of the request
+        :return: float
+            seconds to wait before sending the request
+        """
+        if not self._buckets:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            return max(bucket.reserve(tokens if is_tokens else 1, now)
+                       for bucket, is_tokens in self._buckets)
+
+    def wait(self, tokens=0):
+        """
+        Wait until a request can be sent.
+
+        :param tokens: int
+            estimated number of tokens of the request
+        """
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait_async(self, tokens=0):
+        """
+        Wait until a request can be sent, without blocking the event loop.
+
+        :param tokens: int
+            estimated number of tokens of the request
+        """
+        import asyncio
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def get_limiter(name, requests_per_minute=0, tokens_per_minute=0):
+    """
+    Return the rate limiter shared in the process.
+
+    :param name: str
+        name of the provider
+    :param requests_per_minute: int
+        maximum number of requests per minute, or 0 for no limit
+    :param tokens_per_minute: int
+        maximum number of tokens per minute, or 0 for no limit
+    :return: RateLimiter
+        rate limiter of the provider with the limits
+    """
+    key = (name, requests_per_minute, tokens_per_minute)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+            _limiters[key] = limiter
+    return limiter
+
+
+def error_status(e):
+    """
+    Check whether a request which raised an error should be retried.
+
+    :param e: Exception
+        error raised by the SDK of a provider
+    :return: tuple
+        (retryable, retry_after), where retry_after is seconds given by
+        the Retry-After header, or None
+    """
+    status = getattr(e, 'status_code', None)
+    if status is None:
+        # Errors of google.api_core have HTTP status code as code
+        status = getattr(e, 'code', None)
+    if not isinstance(status, int):
+        return type(e).__name__ in RETRY_ERRORS, None
+    if status not in RETRY_STATUS:
+        return False, None
+    # httpx.Response of openai, anthropic and mistralai
+    response = getattr(e, 'response', None)
+    if response is None:
+        response = getattr(e, 'raw_response', None)
+    headers = getattr(response, 'headers', None)
+    if headers is None:
+        return True, None
+    return True, _retry_after(headers)
+
+
+def _retry_after(headers):
+    """
+    Read Retry-After header.
+
+    :param headers: dict
+        headers of HTTP response
+    :return: float or None
+        seconds to wait, or None when not given
+    """
+    value = headers.get('retry-after-ms')
+    if value is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    import email.utils
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(date.timestamp() - time.time(), 0)
@@ -0,0 +1,141 @@
+"""
+registry - AI providers available in multiai
+
+A provider is implemented by a backend, which sends the requests of
+Prompt. The backends of built-in providers are methods of Prompt. Other
+packages can add a provider by an entry point in "multiai.providers"
+group, such as in pyproject.toml of the package:
+
+    [project.entry-points."multiai.providers"]
+    myai = "myai_multiai:MyAIBackend"
+
+The entry points are found once when multiai is imported, so that the
+providers have command-line options, and the package of the backend is
+imported when the provider is used for the first time.
+"""
+import functools
+import importlib.metadata
+import sys
+import threading
+
+__all__ = [
+    "Backend",
+    "BUILTIN_PROVIDERS",
+    "load_backend",
+    "provider_names",
+]
+
+ENTRY_POINT_GROUP = 'multiai.providers'
+# Providers implemented by Prompt, in the order of command-line options
+BUILTIN_PROVIDERS = ['anthropic', 'google', 'openai', 'perplexity',
+                     'mistral', 'local', 'mock']
+
+_backends: dict[str, 'Backend'] = {}
+_backends_lock = threading.Lock()
+
+
+class Backend():
+    """
+    Interface of the backend of a provider.
+
+    The methods are given the Prompt which sends the request. The
+    arguments of the request are given by client.request_params(), and
+    the answer is given back by client.set_response(), or the error by
+    client.set_error(). The backend is shared by all Prompt objects, so
+    that it should keep its clients and connection pools for reuse.
+
+    Only ask() has to be defined. Unless overridden, ask_async() runs
+    ask() in a thread, and stream() yields the whole answer at once.
+
+    Usage:
+        class MyAIBackend(multiai.Backend):
+            def ask(self, client):
+                params = client.request_params()
+                ...
+                client.set_response(text, finish_reason)
+    """
+
+    def ask(self, client):
+        """
+        Send the request of a Prompt.
+
+        :param client: Prompt
+            client which sends the request
+        """
+        raise NotImplementedError
+
+    async def ask_async(self, client):
+        """
+        Send the request of a Prompt asynchronously.
+
+        :param client: Prompt
+            client which sends the request
+        """
+        import asyncio
+        await asyncio.to_thread(self.ask, client)
+
+    def stream(self, client):
+        """
+        Send the request of a Prompt and yield the answer as it arrives.
+
+        :param client: Prompt
+            client which sends the request
+        :return: generator
+            text chunks of the answer
+        """
+        self.ask(client)
+        if not client.error:
+            yield client.response
+
+
+@functools.cache
+def _entry_points():
+    """
+    Find the providers added by other packages.
+
+    :return: dict
+        entry point for each name of provider. Built-in providers cannot
+        be replaced.
+    """
+    points = {}
+    for point in importlib.metadata.entry_points(group=ENTRY_POINT_GROUP):
+        name = point.name.lower()
+        if name not in BUILTIN_PROVIDERS and name not in points:
+            points[name] = point
+    return points
+
+
+def provider_names():
+    """
+    Return the names of all providers.
+
+    :return: list
+        built-in providers followed by the providers of other packages
+    """
+    return BUILTIN_PROVIDERS + list(_entry_points())
+
+
+def load_backend(name):
+    """
+    Return the backend of a provider added by another package, which is
+    imported at the first call.
+
+    :param name: str
+        name of the provider
+    :return: Backend
+        backend shared in the process
+    """
+    with _backends_lock:
+        backend = _backends.get(name)
+        if backend is None:
+            point = _entry_points()[name]
+            try:
+                backend = point.load()
+            except Exception as e:
+                print(f'Backend of {name} cannot be loaded from {point.value}: {e}')
+                sys.exit(1)
+            # The entry point can be either a class or its instance.
+            if isinstance(backend, type):
+                backend = backend()
+            _backends[name] = backend
+    return backend
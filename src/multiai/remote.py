@@ -0,0 +1,209 @@
+"""
+remote - client of the multiai server started by ai --serve
+
+Only the standard library is used, so that scripts talking to the
+server start quickly.
+"""
+import http.client
+import json
+import os
+import socket
+
+__all__ = [
+    "RemoteClient",
+    "RemoteError",
+]
+
+
+class RemoteError(Exception):
+    """
+    Error returned by the server, or failure to connect to it.
+    """
+
+
+class RemoteClient():
+    """
+    Client of the multiai server, which keeps the connection to it.
+
+    Usage:
+        remote = RemoteClient('127.0.0.1:8765')
+        session = remote.new_session()
+        result = remote.ask('Hello', session=session, provider='openai')
+        print(result['answer'])
+    """
+
+    def __init__(self, address, timeout=None):
+        """
+        :param address: str
+            HOST:PORT of the server, or the path of its Unix socket
+        :param timeout: float
+            seconds to wait for the server, or None for no limit
+        """
+        self.address = address
+        self.timeout = timeout
+        self._connection = None
+
+    def close(self):
+        """
+        Close the connection.
+        """
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def health(self):
+        """
+        Check the server.
+
+        :return: dict
+            status and version of the server
+        """
+        return self._request('GET', '/health')
+
+    def new_session(self):
+        """
+        Start a conversation kept in the server.
+
+        :return: str
+            id of the session
+        """
+        return self._request('POST', '/sessions')['session']
+
+    def delete_session(self, session_id):
+        """
+        Forget a conversation kept in the server.
+
+        :param session_id: str
+            id of the session
+        """
+        self._request('DELETE', f'/sessions/{session_id}')
+
+    def ask(self, prompt, session=None, **options):
+        """
+        Ask a question.
+
+        :param prompt: str
+            prompt to ask AI
+        :param session: str
+            id of the session to continue, or None to ask without history
+        :param options: dict
+            provider, model and temperature
+        :return: dict
+            answer, error, provider, model, session and metrics
+        """
+        return self._request('POST', '/ask',
+                             dict(options, prompt=prompt, session=session))
+
+    def ask_stream(self, prompt, session=None, **options):
+        """
+        Ask a question and yield the answer as it arrives.
+
+        :param prompt: str
+            prompt to ask AI
+        :param session: str
+            id of the session to continue, or None to ask without history
+        :param options: dict
+            provider, model and temperature
+        :return: generator
+            text chunks of the answer. The result, which is returned by
+            ask(), is set to self.result at the end.
+        """
+        self.result = None
+        response = self._send('POST', '/ask', dict(
+            options, prompt=prompt, session=session, stream=True))
+        for line in response:
+            item = json.loads(line)
+            if 'chunk' in item:
+                yield item['chunk']
+            else:
+                self.result = item
+
+    def _request(self, method, path, body=None):
+        """
+        Send a request and read the JSON response.
+
+        :param method: str
+            HTTP method
+        :param path: str
+            path of the API
+        :param body: dict
+            JSON body, or None
+        :return: dict
+            JSON response
+        """
+        return json.loads(self._send(method, path, body).read())
+
+    def _send(self, method, path, body=None):
+        """
+        Send a request, connecting again when the kept connection is
+        closed by the server.
+
+        :param method: str
+            HTTP method
+        :param path: str
+            path of the API
+        :param body: dict
+            JSON body, or None
+        :return: http.client.HTTPResponse
+            response with status 200
+        """
+        data = None if body is None else json.dumps(body).encode()
+        headers = {'Content-Type': 'application/json'}
+        for retry in [True, False]:
+            if self._connection is None:
+                self._connection = self._connect()
+            try:
+                self._connection.request(method, path, data, headers)
+                response = self._connection.getresponse()
+                break
+            except (http.client.RemoteDisconnected, BrokenPipeError,
+                    ConnectionResetError):
+                self.close()
+                if not retry:
+                    raise RemoteError('Connection to the server is closed.')
+            except OSError as e:
+                self.close()
+                raise RemoteError(f'Cannot connect to {self.address}: {e}')
+        if response.status != 200:
+            try:
+                message = json.loads(response.read())['message']
+            except (ValueError, KeyError):
+                message = response.reason
+            raise RemoteError(f'Error {response.status}: {message}')
+        return response
+
+    def _connect(self):
+        """
+        Make a connection to the server.
+
+        :return: http.client.HTTPConnection
+            connection, which connects at the first request
+        """
+        if ':' in self.address and not self.address.startswith(('/', '~', '.')):
+            host, _, port = self.address.rpartition(':')
+            return http.client.HTTPConnection(host, int(port),
+                                              timeout=self.timeout)
+        return _UnixConnection(os.path.expanduser(self.address),
+                               timeout=self.timeout)
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    """
+    HTTP connection over a Unix socket.
+    """
+
+    def __init__(self, path, timeout=None):
+        """
+        :param path: str
+            path of the socket
+        :param timeout: float
+            seconds to wait, or None for no limit
+        """
+        super().__init__('localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
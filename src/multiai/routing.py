@@ -0,0 +1,131 @@
+"""
+routing - latency of providers used to decide when to hedge a request,
+and load balancing of requests across replicas of an endpoint
+"""
+import collections
+import threading
+import time
+
+__all__ = [
+    "acquire_replica",
+    "latency_percentile",
+    "record_latency",
+    "release_replica",
+]
+
+# Number of recent requests kept for each provider
+SAMPLES = 100
+# Percentile is not used until this number of requests are recorded
+MIN_SAMPLES = 5
+
+_latencies: dict[str, collections.deque] = {}
+_latencies_lock = threading.Lock()
+_replicas: dict[str, '_Replicas'] = {}
+_replicas_lock = threading.Lock()
+
+
+class _Replicas():
+    """
+    Requests in progress and failures of the replicas of an endpoint.
+    """
+
+    def __init__(self):
+        # Number of requests in progress for each replica
+        self.active = {}
+        # time.monotonic() of the last failure for each replica
+        self.failed = {}
+        # Replica to start the search from, which is rotated
+        self.turn = 0
+
+
+def record_latency(name, seconds):
+    """
+    Record the latency of a successful request.
+
+    :param name: str
+        name of the provider
+    :param seconds: float
+        time until the answer arrived
+    """
+    with _latencies_lock:
+        latencies = _latencies.get(name)
+        if latencies is None:
+            latencies = collections.deque(maxlen=SAMPLES)
+            _latencies[name] = latencies
+        latencies.append(seconds)
+
+
+def latency_percentile(name, percentile):
+    """
+    Return a percentile of recent latencies of a provider.
+
+    :param name: str
+        name of the provider
+    :param percentile: float
+        percentile between 0 and 100
+    :return: float or None
+        latency in seconds, or None when there are not enough records
+    """
+    with _latencies_lock:
+        latencies = sorted(_latencies.get(name, ()))
+    if len(latencies) < MIN_SAMPLES:
+        return None
+    index = round(percentile / 100 * (len(latencies) - 1))
+    return latencies[min(max(index, 0), len(latencies) - 1)]
+
+
+def acquire_replica(name, urls, cooldown=30):
+    """
+    Choose a replica of an endpoint for a request.
+
+    The replica with the fewest requests in progress is chosen among the
+    replicas which have not failed within cooldown seconds, and ties are
+    broken in turn, so that requests are spread over the replicas. When
+    all of them have failed, all are used. release_replica() must be
+    called when the request is finished.
+
+    :param name: str
+        name of the endpoint
+    :param urls: list
+        base URLs of the replicas
+    :param cooldown: float
+        seconds for which a failed replica is avoided
+    :return: str
+        base URL of the chosen replica
+    """
+    now = time.monotonic()
+    with _replicas_lock:
+        replicas = _replicas.get(name)
+        if replicas is None:
+            replicas = _Replicas()
+            _replicas[name] = replicas
+        healthy = [url for url in urls
+                   if now - replicas.failed.get(url, now - cooldown) >= cooldown]
+        if not healthy:
+            healthy = list(urls)
+        start = replicas.turn % len(healthy)
+        replicas.turn += 1
+        url = min(healthy[start:] + healthy[:start],
+                  key=lambda url: replicas.active.get(url, 0))
+        replicas.active[url] = replicas.active.get(url, 0) + 1
+    return url
+
+
+def release_replica(name, url, failed=False):
+    """
+    Record that a request to a replica is finished.
+
+    :param name: str
+        name of the endpoint
+    :param url: str
+        base URL returned by acquire_replica()
+    :param failed: boolean
+        whether the replica failed, such as a connection error
+    """
+    with _replicas_lock:
+        replicas = _replicas[name]
+        replicas.active[url] -= 1
+        if failed:
+            replicas.failed[url] = time.monotonic()
+        else:
+            replicas.failed.pop(url, None)
@@ -0,0 +1,682 @@
+"""
+server - HTTP/JSON API of multiai kept running in a process
+
+Prompt objects are kept between requests, so that the settings and the
+SDKs are loaded once, and the connection pools of providers, the rate
+limiters and the caches are shared by all requests.
+
+API, where the bodies of requests and responses are JSON:
+    GET    /health        status and version
+    POST   /sessions      start a conversation, returning its session id
+    GET    /sessions      ids of the conversations kept in the server
+    DELETE /sessions/ID   forget a conversation
+    POST   /ask           ask "prompt", optionally with "session",
+                          "provider", "model", "temperature" and "stream".
+                          The response has answer, error, provider, model,
+                          session and metrics. With "stream": true, the
+                          answer is sent as JSON lines of {"chunk": text}
+                          followed by the response.
+    POST   /run           run ai command with "argv", "cwd" and "stdin" for
+                          the thin client started by ai command, only
+                          through the Unix socket, sending
+                          JSON lines of {"out": text}, {"err": text} and
+                          {"page": text} followed by {"exit": status}, or
+                          {"local": true} when the command should be run
+                          by the client, or {"stdin": true} when it should
+                          be sent again with stdin.
+"""
+import contextlib
+import http.server
+import io
+import json
+import os
+import secrets
+import socket
+import socketserver
+import sys
+import threading
+import time
+from .multiai import Provider
+
+__all__ = [
+    "Server",
+]
+
+
+class Server():
+    """
+    multiai server, which answers requests with the forks of a Prompt.
+
+    Usage:
+        server = Server(Prompt())
+        server.serve(host='127.0.0.1', port=8765)
+    """
+
+    def __init__(self, client, session_ttl=3600):
+        """
+        :param client: Prompt
+            client whose settings, SDK clients and caches are shared
+        :param session_ttl: float
+            seconds after which an unused conversation is forgotten
+        """
+        self.client = client
+        self.session_ttl = session_ttl
+        # id: [Prompt, lock of the conversation, last used time]
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def new_session(self):
+        """
+        Start a conversation. When autosave is set in [session] section,
+        the conversation is also saved to the session file, and it can be
+        resumed with ai --resume.
+
+        :return: str
+            id of the session
+        """
+        job = self._job()
+        if job.sessions is not None and job.autosave:
+            session_id = job.save_session()
+        else:
+            session_id = secrets.token_hex(8)
+        with self._lock:
+            self._expire()
+            self._sessions[session_id] = [job, threading.Lock(), time.monotonic()]
+        return session_id
+
+    def sessions(self):
+        """
+        Return the ids of the conversations kept in the server.
+
+        :return: list
+            ids of the sessions
+        """
+        with self._lock:
+            self._expire()
+            return list(self._sessions)
+
+    def delete_session(self, session_id):
+        """
+        Forget a conversation. The conversation saved to the session file
+        is kept.
+
+        :param session_id: str
+            id of the session
+        :return: boolean
+            False when the session is not found
+        """
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def ask(self, request, stream=None):
+        """
+        Ask a question.
+
+        :param request: dict
+            "prompt", and optionally "session", "provider", "model" and
+            "temperature"
+        :param stream: function
+            function called with each text chunk of the answer, or None
+            to ask without streaming
+        :return: dict
+            answer, error, provider, model, session and metrics
+        """
+        prompt = request.get('prompt')
+        if not isinstance(prompt, str) or not prompt:
+            raise ValueError('prompt is required.')
+        provider = self.client.ai_provider
+        if request.get('provider'):
+            try:
+                provider = Provider[str(request['provider']).upper()]
+            except KeyError:
+                raise ValueError(
+                    f'AI provider "{request["provider"]}" is not available.')
+        temperature = request.get('temperature')
+        if temperature is not None and (
+                not isinstance(temperature, (int, float)) or temperature < 0):
+            raise ValueError('temperature should be a number >=0.')
+        session_id = request.get('session')
+        if session_id is None:
+            job = self._job()
+            lock = threading.Lock()
+        else:
+            job, lock = self._session(session_id)
+        with lock:
+            job.ai_provider = provider
+            # Fallback providers are those of the default provider.
+            job.fallback_providers = []
+            if provider == self.client.ai_provider:
+                job.fallback_providers = list(self.client.fallback_providers)
+            job.model = request.get('model') or getattr(
+                self.client, 'model_' + provider.name.lower())
+            setattr(job, 'model_' + provider.name.lower(), job.model)
+            job.temperature = self.client.temperature
+            if temperature is not None:
+                job.temperature = float(temperature)
+            if stream is None:
+                answer = job.ask(prompt)
+            else:
+                for chunk in job.ask_stream(prompt):
+                    stream(chunk)
+                answer = job.answer
+            return {
+                'answer': str(answer),
+                'error': job.error,
+                'provider': job.answered_by.name.lower(),
+                'model': job.metrics['model'] if job.metrics else job.model,
+                'session': session_id,
+                'metrics': job.metrics,
+            }
+
+    def run(self, request, send):
+        """
+        Run ai command for the thin client, which is started by ai command
+        when the server is running.
+
+        The command is run with a fork of the client, and its stdin,
+        stdout and stderr are those of the thin client. Commands which
+        need the terminal, or which would read other settings or files
+        than when run by the client, are not run.
+
+        :param request: dict
+            "argv", "prog" (name of the command), "cwd" of the client,
+            "stdin" (text, or None when it is
+            not read yet), and whether "stdin_tty", "stdout_tty" and
+            "stderr_tty" are terminals
+        :param send: function
+            function called with each output of the command, such as
+            {"out": text}, {"err": text} and {"page": text}
+        :return: dict
+            {"exit": status}, {"local": True} when the command should be
+            run by the client, or {"stdin": True} when the command should
+            be sent again with stdin
+        """
+        argv = request.get('argv')
+        if not isinstance(argv, list) or not all(isinstance(arg, str) for arg in argv):
+            raise ValueError('argv should be a list of strings.')
+        if not isinstance(request.get('cwd'), str):
+            raise ValueError('cwd is required.')
+        if self.client.settings.changed():
+            # Settings of the server are older than those of the client.
+            return {'local': True}
+        from .entry import main
+        _install_streams()
+        job = self._job()
+        # Options such as --stats and --fallback change only this command.
+        job.hooks = list(self.client.hooks)
+        job.fallback_providers = list(self.client.fallback_providers)
+        stdin = request.get('stdin')
+        stdout = _CommandOutput(send, 'out', request.get('stdout_tty', False))
+        stderr = _CommandOutput(send, 'err', request.get('stderr_tty', False))
+        status = 0
+        with _redirect(io.StringIO(stdin or ''), stdout, stderr):
+            try:
+                main(argv, client=job, check=_command_check(request),
+                     prog=request.get('prog') or 'ai')
+            except _RunLocally:
+                return {'local': True}
+            except _StdinRequired:
+                return {'stdin': True}
+            except SystemExit as e:
+                status = e.code
+            except Exception as e:
+                print(f'{type(e).__name__}: {e}', file=sys.stderr)
+                status = 1
+            if status is None:
+                status = 0
+            elif not isinstance(status, int):
+                # sys.exit('message') shows the message.
+                print(status, file=sys.stderr)
+                status = 1
+        return {'exit': status}
+
+    def serve(self, host=None, port=None, socket_path=None):
+        """
+        Serve the API until interrupted.
+
+        :param host: str
+            host to listen to, such as 127.0.0.1
+        :param port: int
+            TCP port, or None not to listen to TCP
+        :param socket_path: str
+            path of the Unix socket, or None not to listen to it
+        """
+        servers = []
+        if port:
+            server = _TCPServer((host, port), _Handler)
+            servers.append(server)
+            print(f'multiai server at http://{host}:{server.server_address[1]}')
+        if socket_path:
+            socket_path = os.path.expanduser(socket_path)
+            _remove_stale_socket(socket_path)
+            directory = os.path.dirname(socket_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Only the user can ask through the socket, from its creation.
+            umask = os.umask(0o177)
+            try:
+                server = _UnixServer(socket_path, _UnixHandler)
+            finally:
+                os.umask(umask)
+            servers.append(server)
+            print(f'multiai server at {socket_path}')
+        if not servers:
+            print('Set port or socket in [server] section.')
+            sys.exit(1)
+        for server in servers:
+            server.app = self
+        _install_streams()
+        threads = [threading.Thread(target=server.serve_forever, daemon=True)
+                   for server in servers[1:]]
+        for thread in threads:
+            thread.start()
+        try:
+            servers[0].serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for server in servers[1:]:
+                server.shutdown()
+            for server in servers:
+                server.server_close()
+            if socket_path and os.path.exists(socket_path):
+                os.remove(socket_path)
+
+    def _job(self):
+        """
+        Return a fork of the client with a new conversation.
+
+        :return: Prompt
+            fork sharing SDK clients with self.client
+        """
+        job = self.client._fork(self.client.ai_provider)
+        job.clear()
+        return job
+
+    def _session(self, session_id):
+        """
+        Return the client of a conversation. A conversation which is not
+        kept in the server is resumed from the session file.
+
+        :param session_id: str
+            id of the session
+        :return: tuple
+            (Prompt, lock of the conversation)
+        """
+        with self._lock:
+            self._expire()
+            item = self._sessions.get(session_id)
+            if item is None:
+                sessions = self.client.sessions
+                if sessions is None or not sessions.exists(session_id):
+                    raise KeyError(session_id)
+                job = self._job()
+                job.load_session(session_id)
+                item = [job, threading.Lock(), None]
+                self._sessions[session_id] = item
+            item[2] = time.monotonic()
+            return item[0], item[1]
+
+    def _expire(self):
+        """
+        Forget conversations unused for self.session_ttl seconds.
+        It is called with self._lock.
+        """
+        limit = time.monotonic() - self.session_ttl
+        for session_id in [session_id for session_id, item in self._sessions.items()
+                           if item[2] < limit]:
+            del self._sessions[session_id]
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """
+    Handler of the requests to the API.
+    """
+    # Keep the connection for the following requests
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are sent without waiting for ACK
+    disable_nagle_algorithm = True
+    # Commands, which can read and write files, are run only for the user
+    run_command = False
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._reply(200, {'status': 'ok', 'version': self.server.app.client.version})
+        elif self.path == '/sessions':
+            self._reply(200, {'sessions': self.server.app.sessions()})
+        else:
+            self._reply(404, {'message': f'{self.path} is not found.'})
+
+    def do_POST(self):
+        try:
+            body = self._body()
+        except ValueError:
+            self._reply(400, {'message': 'Body should be a JSON object.'})
+            return
+        if self.path == '/sessions':
+            self._reply(200, {'session': self.server.app.new_session()})
+        elif self.path == '/ask':
+            self._ask(body)
+        elif self.path == '/run' and self.run_command:
+            self._run(body)
+        else:
+            self._reply(404, {'message': f'{self.path} is not found.'})
+
+    def do_DELETE(self):
+        prefix = '/sessions/'
+        if self.path.startswith(prefix) and self.server.app.delete_session(
+                self.path[len(prefix):]):
+            self._reply(200, {})
+        else:
+            self._reply(404, {'message': f'{self.path} is not found.'})
+
+    def log_message(self, format, *args):
+        # Requests are not logged.
+        pass
+
+    def _ask(self, body):
+        """
+        Answer POST /ask.
+
+        :param body: dict
+            request
+        """
+        app = self.server.app
+        stream = None
+        if body.get('stream'):
+            self._start_lines()
+            stream = self._write_text_chunk
+        try:
+            result = app.ask(body, stream=stream)
+        except KeyError as e:
+            result = (404, {'message': f'Session {e.args[0]} is not found.'})
+        except ValueError as e:
+            result = (400, {'message': str(e)})
+        except (Exception, SystemExit) as e:
+            # Prompt exits on some errors of settings.
+            result = (500, {'message': f'{type(e).__name__}: {e}'})
+        else:
+            result = (200, result)
+        if stream is None:
+            self._reply(*result)
+            return
+        # The status is already sent.
+        status, data = result
+        if status != 200:
+            data = dict(data, answer=data['message'], error=True)
+        self._write_chunk(data)
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _run(self, body):
+        """
+        Answer POST /run.
+
+        :param body: dict
+            request
+        """
+        started = False
+
+        def send(data):
+            nonlocal started
+            if not started:
+                self._start_lines()
+                started = True
+            self._write_chunk(data)
+        try:
+            result = self.server.app.run(body, send)
+        except ValueError as e:
+            self._reply(400, {'message': str(e)})
+            return
+        send(result)
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _body(self):
+        """
+        Read the JSON body of the request.
+
+        :return: dict
+            body, which is empty when not given
+        """
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        body = json.loads(self.rfile.read(length))
+        if not isinstance(body, dict):
+            raise ValueError('not an object')
+        return body
+
+    def _reply(self, status, data):
+        """
+        Send a JSON response.
+
+        :param status: int
+            HTTP status
+        :param data: dict
+            response
+        """
+        body = json.dumps(data, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_text_chunk(self, chunk):
+        """
+        Send a text chunk of a streamed answer.
+
+        :param chunk: str
+            text chunk
+        """
+        self._write_chunk({'chunk': chunk})
+
+    def _start_lines(self):
+        """
+        Send the headers of a response of JSON lines.
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+    def _write_chunk(self, data):
+        """
+        Send a JSON line in chunked transfer encoding.
+
+        :param data: dict
+            data of the line
+        """
+        line = (json.dumps(data, ensure_ascii=False) + '\n').encode()
+        self.wfile.write(f'{len(line):x}\r\n'.encode() + line + b'\r\n')
+        self.wfile.flush()
+
+
+class _UnixHandler(_Handler):
+    """
+    Handler of the requests through a Unix socket, which has no TCP option
+    and is used only by the user.
+    """
+    disable_nagle_algorithm = False
+    run_command = True
+
+
+class _TCPServer(http.server.ThreadingHTTPServer):
+    """
+    HTTP server on TCP, answering each connection in a thread.
+    """
+    daemon_threads = True
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    HTTP server on a Unix socket, answering each connection in a thread.
+    """
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects (host, port).
+        return request, ('localhost', 0)
+
+
+class _RunLocally(Exception):
+    """
+    Command which should be run by the thin client.
+    """
+
+
+class _StdinRequired(Exception):
+    """
+    Command which reads stdin not sent by the thin client.
+    """
+
+
+class _CommandOutput():
+    """
+    stdout or stderr of a command run for the thin client, which sends
+    what is written to the client.
+    """
+    encoding = 'utf-8'
+
+    def __init__(self, send, key, tty):
+        """
+        :param send: function
+            function called with each JSON line to the client
+        :param key: str
+            "out" or "err"
+        :param tty: boolean
+            whether the output of the client is a terminal
+        """
+        self._send = send
+        self._key = key
+        self._tty = bool(tty)
+
+    def write(self, text):
+        if text:
+            self._send({self._key: text})
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return self._tty
+
+    def page(self, text):
+        """
+        Show long text with the pager of the client, called by print_long.
+
+        :param text: str
+            text to display
+        """
+        self._send({'page': text})
+
+
+class _ThreadStream():
+    """
+    Standard stream of the server, which is replaced in the threads
+    running commands for thin clients.
+    """
+
+    def __init__(self, stream):
+        """
+        :param stream: file object
+            stream used by other threads
+        """
+        self._stream = stream
+        self._local = threading.local()
+
+    def __getattr__(self, name):
+        return getattr(getattr(self._local, 'stream', None) or self._stream, name)
+
+
+def _install_streams():
+    """
+    Replace sys.stdin, sys.stdout and sys.stderr with _ThreadStream.
+    """
+    for name in ['stdin', 'stdout', 'stderr']:
+        if not isinstance(getattr(sys, name), _ThreadStream):
+            setattr(sys, name, _ThreadStream(getattr(sys, name)))
+
+
+@contextlib.contextmanager
+def _redirect(stdin, stdout, stderr):
+    """
+    Use the streams of a thin client in this thread.
+
+    :param stdin: file object
+        stdin
+    :param stdout: _CommandOutput
+        stdout
+    :param stderr: _CommandOutput
+        stderr
+    """
+    streams = [(sys.stdin, stdin), (sys.stdout, stdout), (sys.stderr, stderr)]
+    for proxy, stream in streams:
+        proxy._local.stream = stream
+    try:
+        yield
+    finally:
+        for proxy, stream in streams:
+            proxy._local.stream = None
+
+
+def _command_check(request):
+    """
+    Return a function checking whether a command can be run by the server.
+
+    :param request: dict
+        request of the thin client
+    :return: function
+        function given to entry.main, which raises _RunLocally or
+        _StdinRequired
+    """
+    cwd = request['cwd']
+
+    def check(args, client):
+        # The browser and the clipboard are those of the client.
+        if args.serve or args.document or client.always_copy or getattr(args, 'copy', False):
+            raise _RunLocally
+        # Commands which exit before asking do not read stdin.
+        asks = not (args.document or args.sessions or args.batch)
+        interactive = asks and (not args.prompt or bool(args.url))
+        if interactive or '-' in (args.url or []) or args.batch == '-':
+            if request.get('stdin_tty'):
+                # Conversation and editing need the terminal.
+                raise _RunLocally
+            if request.get('stdin') is None:
+                raise _StdinRequired
+        if os.path.realpath(cwd) == os.path.realpath(os.getcwd()):
+            return
+        # Settings of .multiai and relative paths depend on the directory.
+        if os.path.exists(os.path.join(cwd, '.multiai')) or os.path.exists('.multiai'):
+            raise _RunLocally
+        paths = [url for url in args.url or [] if url != '-' and '://' not in url]
+        if getattr(args, 'log', False) or client.always_log:
+            paths.append(client.log_file)
+        if args.batch:
+            paths += [path for path in [args.batch, args.output] if path != '-']
+        if not all(os.path.isabs(path) for path in paths):
+            raise _RunLocally
+    return check
+
+
+def _remove_stale_socket(path):
+    """
+    Remove a Unix socket left by a server which is not running.
+
+    :param path: str
+        path of the socket
+    """
+    if not os.path.exists(path):
+        return
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        os.remove(path)
+        return
+    finally:
+        sock.close()
+    print(f'multiai server is already running at {path}')
+    sys.exit(1)
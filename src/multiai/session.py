@@ -0,0 +1,179 @@
+"""
+session - conversations saved to a file to be resumed later
+"""
+import datetime
+import secrets
+import time
+from .cache import _Database
+
+__all__ = [
+    "SessionStore",
+]
+
+
+class SessionStore(_Database):
+    """
+    Conversations stored in a SQLite database.
+
+    Each message is stored in a row when it is added, so that saving
+    takes the same time however long the conversation is.
+
+    Usage:
+        sessions = SessionStore('~/.local/share/multiai/sessions.sqlite')
+        session_id = sessions.new_id()
+        sessions.append(session_id, [(0, 'user', prompt, None)])
+        offset, summary, messages = sessions.load(session_id)
+    """
+    schema = '''CREATE TABLE IF NOT EXISTS sessions (
+        id TEXT PRIMARY KEY,
+        created REAL,
+        updated REAL,
+        summary TEXT,
+        start INTEGER DEFAULT 0);
+    CREATE TABLE IF NOT EXISTS messages (
+        session TEXT,
+        position INTEGER,
+        role TEXT,
+        content TEXT,
+        provider TEXT,
+        PRIMARY KEY (session, position))'''
+
+    @staticmethod
+    def new_id():
+        """
+        Make a new session id.
+
+        :return: str
+            id made of the current time and random letters
+        """
+        now = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        return f'{now}-{secrets.token_hex(2)}'
+
+    def append(self, session_id, messages):
+        """
+        Add messages to a session.
+
+        The session is created at the first message.
+
+        :param session_id: str
+            id of the session
+        :param messages: list
+            (position, role, content, provider) of messages
+        """
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            self._touch(db, session_id, now)
+            db.executemany(
+                'INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?)',
+                [(session_id,) + tuple(message) for message in messages])
+            db.commit()
+
+    def summarize(self, session_id, offset, summary):
+        """
+        Replace the messages before a position with their summary.
+
+        :param session_id: str
+            id of the session
+        :param offset: int
+            position of the first message to keep
+        :param summary: str
+            summary of the earlier conversation
+        """
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            self._touch(db, session_id, now)
+            db.execute(
+                'UPDATE sessions SET summary = ?, start = ? WHERE id = ?',
+                (summary, offset, session_id))
+            db.execute(
+                'DELETE FROM messages WHERE session = ? AND position < ?',
+                (session_id, offset))
+            db.commit()
+
+    def load(self, session_id):
+        """
+        Read a session.
+
+        :param session_id: str
+            id of the session
+        :return: tuple or None
+            (offset, summary, messages), where messages are (role,
+            content, provider) in order, or None when not found
+        """
+        with self._lock:
+            db = self._connect()
+            row = db.execute(
+                'SELECT start, summary FROM sessions WHERE id = ?',
+                (session_id,)).fetchone()
+            if row is None:
+                return None
+            messages = db.execute(
+                '''SELECT role, content, provider FROM messages
+                WHERE session = ? ORDER BY position''',
+                (session_id,)).fetchall()
+        return row[0], row[1], messages
+
+    def exists(self, session_id):
+        """
+        Check whether a session is saved.
+
+        :param session_id: str
+            id of the session
+        :return: boolean
+            True when saved
+        """
+        with self._lock:
+            return self._connect().execute(
+                'SELECT 1 FROM sessions WHERE id = ?',
+                (session_id,)).fetchone() is not None
+
+    def latest(self):
+        """
+        Return the id of the session updated last.
+
+        :return: str or None
+            id of the session, or None when no session is saved
+        """
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT id FROM sessions ORDER BY updated DESC LIMIT 1'
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def recent(self, limit=20):
+        """
+        Return sessions updated recently.
+
+        :param limit: int
+            maximum number of sessions
+        :return: list
+            (id, updated time, number of messages, first message) of
+            sessions, the latest first
+        """
+        with self._lock:
+            return self._connect().execute(
+                '''SELECT id, updated,
+                (SELECT COUNT(*) FROM messages WHERE session = id),
+                (SELECT content FROM messages WHERE session = id
+                 ORDER BY position LIMIT 1)
+                FROM sessions ORDER BY updated DESC LIMIT ?''',
+                (limit,)).fetchall()
+
+    def _touch(self, db, session_id, now):
+        """
+        Create a session if it does not exist, and set its updated time.
+
+        :param db: sqlite3.Connection
+            connection to the database
+        :param session_id: str
+            id of the session
+        :param now: float
+            current time
+        """
+        db.execute(
+            'INSERT OR IGNORE INTO sessions (id, created, updated) VALUES (?, ?, ?)',
+            (session_id, now, now))
+        db.execute('UPDATE sessions SET updated = ? WHERE id = ?',
+                   (now, session_id))
@@ -0,0 +1,126 @@
+"""
+settings - settings of multiai read from the settings files
+"""
+import configparser
+import os
+import threading
+
+__all__ = [
+    "Settings",
+    "load_settings",
+]
+
+_settings = None
+_settings_lock = threading.Lock()
+
+
+class Settings(configparser.ConfigParser):
+    """
+    Settings read from the settings files.
+
+    The files are read in the order of data/system.ini, ~/.multiai
+    and .multiai, and the latter overwrite the former.
+    Values are read with the methods of configparser.ConfigParser,
+    such as get(), getint(), getfloat() and getboolean(), or converted
+    at once to typed values by typed(), which keeps them.
+
+    Usage:
+        settings = Settings()
+        temperature = settings.getfloat('default', 'temperature')
+    """
+
+    def __init__(self, files=None):
+        """
+        :param files: list
+            settings files to read. Default is default_files().
+        """
+        # Typed values for each conversion function
+        self._typed = {}
+        self._typed_lock = threading.Lock()
+        super().__init__()
+        if files is None:
+            files = default_files()
+        self.files = files
+        self.mtimes = _mtimes(files)
+        self.read(files)
+
+    def typed(self, convert):
+        """
+        Return typed values converted from the settings. The conversion
+        is done at the first call for each function, and done again after
+        a value is changed by set().
+
+        :param convert: function
+            function which takes the settings and returns typed values
+        :return: object
+            values returned by convert
+        """
+        with self._typed_lock:
+            if convert not in self._typed:
+                self._typed[convert] = convert(self)
+            return self._typed[convert]
+
+    def set(self, section, option, value=None):
+        super().set(section, option, value)
+        with self._typed_lock:
+            self._typed = {}
+
+    def changed(self):
+        """
+        Check whether any of the settings files is changed after reading.
+
+        :return: boolean
+            True when changed
+        """
+        return _mtimes(self.files) != self.mtimes
+
+
+def default_files():
+    """
+    Return the settings files in the order to read.
+
+    :return: list
+        absolute paths of data/system.ini, ~/.multiai and .multiai
+    """
+    here = os.path.abspath(os.path.dirname(__file__))
+    return [
+        os.path.join(here, 'data/system.ini'),
+        os.path.expanduser('~/.multiai'),
+        os.path.abspath('.multiai'),
+    ]
+
+
+def load_settings():
+    """
+    Return the settings shared in the process.
+
+    The settings files are read at the first call, and read again only
+    when any of them is modified or the current directory is changed.
+
+    :return: Settings
+        settings
+    """
+    global _settings
+    files = default_files()
+    with _settings_lock:
+        if _settings is None or _settings.files != files or _settings.changed():
+            _settings = Settings(files)
+        return _settings
+
+
+def _mtimes(files):
+    """
+    Return modification times of files.
+
+    :param files: list
+        files
+    :return: list
+        modification time of each file, or None when it does not exist
+    """
+    mtimes = []
+    for file in files:
+        try:
+            mtimes.append(os.stat(file).st_mtime_ns)
+        except OSError:
+            mtimes.append(None)
+    return mtimes
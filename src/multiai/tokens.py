@@ -0,0 +1,28 @@
+"""
+tokens - fast local estimation of the number of tokens
+"""
+
+__all__ = [
+    "estimate_tokens",
+]
+
+# Average number of ASCII characters per token of English text
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """
+    Estimate the number of tokens of text without a tokenizer.
+
+    ASCII text is counted as CHARS_PER_TOKEN characters per token,
+    and other characters, such as CJK characters, as a token each.
+    It is an approximation that works for any provider.
+
+    :param text: str
+        text to count
+    :return: int
+        estimated number of tokens
+    """
+    non_ascii = len(text) - len(text.encode('ascii', 'ignore'))
+    ascii_chars = len(text) - non_ascii
+    return -(-ascii_chars // CHARS_PER_TOKEN) + non_ascii